@@ -9,7 +9,47 @@ import re     # Used for sub function in regular expression when filtering out
                     # brackets, parentheses, etc. to isolate the (x1, y1) and 
                     # (x2, y2) coordinates.
 
-import sys    # Python library for argv[]
+import argparse  # Command line arguments (replaces reading sys.argv[]).
+
+import heapq  # Priority queue for the sweep-line event schedule.
+
+import math   # ceil/sqrt for sizing the spatial grid.
+
+from array import array  # Compact numeric columns for SegmentStore.
+
+import mmap   # Map big input files into memory instead of reading row by row.
+
+import multiprocessing  # Process pool for counting intersections on every core.
+
+import weakref  # Makes sure shared memory is freed if a run is cut short.
+
+import atexit  # Dump the instrumentation report when the program ends.
+
+import json   # The instrumentation report is written as JSON.
+
+import os     # The INSTRUMENT environment variable.
+
+import sys    # The instrumentation report goes to stderr by default.
+
+import time   # Wall-clock timers for the program's phases.
+
+from fractions import Fraction  # Exact arithmetic for the filtered predicates.
+
+# Shared memory segments need Python 3.8 or newer. Without them the
+# 'parallel' backend is not available.
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+from collections import defaultdict  # Per-line intersection counts.
+
+# NumPy is only needed for the 'numpy' backend, so the rest of the program
+# still runs without it.
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 # We want to create a Coordinate class because we don't know how many coordinates
@@ -40,6 +80,93 @@ class Line:
         self.x2y2 = x2y2
 
 
+# One Line holding two Coordinates is three objects with a __dict__ each, which
+# adds up to hundreds of bytes per line on big files. SegmentStore keeps all
+# the lines in five flat columns instead: the index of every line and its
+# x1, y1, x2, y2 as C doubles (8 bytes each).
+class SegmentStore:
+    def __init__(self):
+        self.index = array('q')
+        self.x1 = array('d')
+        self.y1 = array('d')
+        self.x2 = array('d')
+        self.y2 = array('d')
+
+    # Add one line to the end of the store.
+    def append(self, index, x1, y1, x2, y2):
+        self.index.append(index)
+        self.x1.append(x1)
+        self.y1.append(y1)
+        self.x2.append(x2)
+        self.y2.append(y2)
+
+    def __len__(self):
+        return len(self.index)
+
+    # store[row] gives a LineView, which can be used anywhere a Line is.
+    def __getitem__(self, row):
+        if row < 0:
+            row = row + len(self)
+        if not 0 <= row < len(self):
+            raise IndexError('SegmentStore row out of range')
+        return LineView(self, row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield LineView(self, row)
+
+    # Count the lines in rows that intersect the line in row, reading the
+    # columns directly instead of going through Coordinate objects.
+    # RETURN TYPE: count INTEGER
+    def count_intersections(self, row, rows):
+        index, x1, y1, x2, y2 = self.index, self.x1, self.y1, self.x2, self.y2
+        ax, ay, bx, by = x1[row], y1[row], x2[row], y2[row]
+        line_index = index[row]
+        count = 0
+        for other in rows:
+            if index[other] != line_index and intersect_xy(
+                    ax, ay, bx, by, x1[other], y1[other], x2[other], y2[other]):
+                count = count + 1
+        return count
+
+
+# A view of one row of a SegmentStore. It looks like a Line (index, x1y1,
+# x2y2) but only holds the store and the row number, and __slots__ means it
+# has no __dict__ of its own.
+class LineView:
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    @property
+    def index(self):
+        return self.store.index[self.row]
+
+    # print_result sorts by swapping index values, so allow setting it.
+    @index.setter
+    def index(self, value):
+        self.store.index[self.row] = value
+
+    @property
+    def x1y1(self):
+        return PointView(self.store.x1[self.row], self.store.y1[self.row])
+
+    @property
+    def x2y2(self):
+        return PointView(self.store.x2[self.row], self.store.y2[self.row])
+
+
+# A light Coordinate with __slots__, handed out by LineView.
+class PointView:
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
 # The "ccw" and "intersect" functions were taken from Bryce Boe. The article can
 # be found at:
         # http://bryceboe.com/2006/10/23/line-segment-intersection-algorithm/
@@ -61,12 +188,75 @@ def ccw(A, B, C):
 # RETURN TYPE: BOOLEAN
 def intersect(A, B, C, D):
     return ccw(A,C,D) != ccw(B,C,D) and ccw(A,B,C) != ccw(A,B,D)   # Returns a true or false
+
+
+# The same ccw and intersect tests on plain numbers instead of objects with
+# .x and .y, for code that reads coordinates straight from a SegmentStore.
+# RETURN TYPE: BOOLEAN
+def ccw_xy(ax, ay, bx, by, cx, cy):
+    return (cy-ay)*(bx-ax) > (by-ay)*(cx-ax)
+
+
+# RETURN TYPE: BOOLEAN
+def intersect_xy(ax, ay, bx, by, cx, cy, dx, dy):
+    return (ccw_xy(ax, ay, cx, cy, dx, dy) != ccw_xy(bx, by, cx, cy, dx, dy) and
+            ccw_xy(ax, ay, bx, by, cx, cy) != ccw_xy(ax, ay, bx, by, dx, dy))
+
+
+# ccw compares two rounded float products, so when A, B and C are (almost)
+# on one line the rounding errors can give the wrong answer, and a line
+# that just touches another may or may not count as crossing it. Doing the
+# whole test with Fractions is always right but 50-100 times slower.
+#
+# The filtered versions below do the float test first and also work out how
+# big its rounding error can be (Shewchuk's bound for the orientation test:
+# the error of det = left - right is at most CCW_ERROR_BOUND times
+# |left| + |right|). Only when det is inside that band is the test done
+# again with Fractions, which are exact for float inputs. Almost every call
+# takes the float path, so they are nearly as fast, but always give the
+# answer exact arithmetic would.
+CCW_ERROR_BOUND = (3.0 + 16.0 * 2.0 ** -53) * 2.0 ** -53
+
+
+# ccw_xy with exact rational arithmetic.
+# RETURN TYPE: BOOLEAN
+def ccw_exact_xy(ax, ay, bx, by, cx, cy):
+    ax, ay, bx, by, cx, cy = (Fraction(ax), Fraction(ay), Fraction(bx),
+                              Fraction(by), Fraction(cx), Fraction(cy))
+    return (cy-ay)*(bx-ax) > (by-ay)*(cx-ax)
+
+
+# ccw_xy with a float filter and an exact fallback.
+# RETURN TYPE: BOOLEAN
+def ccw_filtered_xy(ax, ay, bx, by, cx, cy):
+    left = (cy-ay)*(bx-ax)
+    right = (by-ay)*(cx-ax)
+    det = left - right
+    bound = CCW_ERROR_BOUND * (abs(left) + abs(right))
+    if det > bound:
+        return True
+    if det < -bound:
+        return False
+    if stats is not None:
+        stats['counters']['exact_ccw'] += 1
+    return ccw_exact_xy(ax, ay, bx, by, cx, cy)
+
+
+# ccw with a float filter and an exact fallback.
+# RETURN TYPE: BOOLEAN
+def ccw_filtered(A, B, C):
+    return ccw_filtered_xy(A.x, A.y, B.x, B.y, C.x, C.y)
     
 
 # Read, parse, extract information, and store information into the lines list.
-# RETURN TYPE: lines LIST of objects
-def get_lines(file_name):
-    lines = []                                # Allocate lines variable for empty list
+# With columnar=True the lines are stored in a SegmentStore instead of one Line
+# object per row.
+# RETURN TYPE: lines LIST of objects (or SegmentStore)
+def get_lines(file_name, columnar=False):
+    if columnar:
+        lines = SegmentStore()
+    else:
+        lines = []                            # Allocate lines variable for empty list
     with open(file_name, 'r') as f:           # Open will return a file object with "r" or read-only priviledge.
         # Read file row by row
         for row in f:
@@ -105,6 +295,12 @@ def get_lines(file_name):
                     # [37.788353, -122.387695, 37.829853, -122.294312]
                     points.append(float_new_point)
                 
+                # The store takes the numbers as they are, no objects needed.
+                if columnar:
+                    lines.append(int(lineNumber), points[0], points[1],
+                                 points[2], points[3])
+                    continue
+                
                 # Now that we have extracted a line's coordinates into a list, 
                 # we need to create the Coordinate objects. Two per line.
                 # x1y1: x1 and y1
@@ -122,11 +318,98 @@ def get_lines(file_name):
     return lines  # Return the list of line numbers
 
 
+# get_lines splits every row twice and runs an uncompiled re.sub once per
+# coordinate, which is most of the load time on big files. The loaders below
+# follow the same format rules, "<line number>: <four numbers>" where anything
+# that is not part of a number (brackets, parentheses, commas, spaces) is
+# skipped, but they pull out all five numbers of a row with one compiled
+# pattern that runs over the whole file (or a big chunk of it) at once.
+ROW_PATTERN = re.compile(
+    rb'^[ \t]*(-?[0-9]+)[ \t]*:'
+    rb'[^0-9.\n-]*([0-9.-]+)[^0-9.\n-]*([0-9.-]+)'
+    rb'[^0-9.\n-]*([0-9.-]+)[^0-9.\n-]*([0-9.-]+)',
+    re.MULTILINE)
+
+
+# Load a whole file into a SegmentStore. The file is mapped into memory, and
+# the columns are allocated up front (one row per newline, at most) and then
+# trimmed to the number of rows found.
+# RETURN TYPE: SegmentStore
+def load_lines(file_name):
+    store = SegmentStore()
+    with open(file_name, 'rb') as f:
+        # mmap can't map an empty file.
+        if f.seek(0, 2) == 0:
+            return store
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            # Count newlines a slice at a time so the file is never copied.
+            capacity = 1
+            for start in range(0, len(data), 1 << 20):
+                capacity = capacity + data[start:start + (1 << 20)].count(b'\n')
+            index = array('q', bytes(8 * capacity))
+            x1, y1, x2, y2 = (array('d', bytes(8 * capacity)) for i in range(4))
+
+            rows = 0
+            for match in ROW_PATTERN.finditer(data):
+                index[rows] = int(match.group(1))
+                x1[rows] = float(match.group(2))
+                y1[rows] = float(match.group(3))
+                x2[rows] = float(match.group(4))
+                y2[rows] = float(match.group(5))
+                rows = rows + 1
+
+    for column in (index, x1, y1, x2, y2):
+        del column[rows:]
+    store.index, store.x1, store.y1, store.x2, store.y2 = index, x1, y1, x2, y2
+    return store
+
+
+# Read a file in large chunks and yield the lines as SegmentStores of up to
+# batch_size rows, so work can start before the whole file is parsed. A row
+# cut in half at the end of a chunk is carried over to the next one.
+# RETURN TYPE: GENERATOR of SegmentStore
+def iter_line_batches(file_name, batch_size=65536, chunk_size=1 << 20):
+    batch = SegmentStore()
+    leftover = b''
+    with open(file_name, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                data = leftover + chunk
+                cut = data.rfind(b'\n') + 1
+                data, leftover = data[:cut], data[cut:]
+            else:
+                data, leftover = leftover, b''
+
+            for match in ROW_PATTERN.finditer(data):
+                batch.append(int(match.group(1)), float(match.group(2)),
+                             float(match.group(3)), float(match.group(4)),
+                             float(match.group(5)))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = SegmentStore()
+
+            if not chunk:
+                break
+    if len(batch) > 0:
+        yield batch
+
+
 # This function checks every line and counts the number of intersections each line has.
+# If a counts map from sweep_line_counts is given, the answer is looked up in it
+# instead of comparing lineNum against every other line.
 # RETURN TYPE: count INTEGER
-def check_line(lineNum, lines):
+def check_line(lineNum, lines, counts=None):
+    if counts is not None:
+        return counts[lineNum.index]
+
+    # Rows of a SegmentStore are compared straight from its columns.
+    if isinstance(lineNum, LineView):
+        return lineNum.store.count_intersections(
+            lineNum.row, [line.row for line in lines])
+
     count = 0
-    
+
     for line in lines:
     
         # if ids of lines not equal
@@ -139,25 +422,820 @@ def check_line(lineNum, lines):
     return count
 
 
+# The brute force check_line above compares every pair of lines, which is
+# O(n^2) calls to intersect per pass. The functions below are a sweep-line
+# (Bentley-Ottmann) engine: we move a vertical line from left to right across
+# the plane and only ever compare lines that are next to each other along the
+# sweep line. Every pair that it reports is still confirmed with intersect, so
+# the answers use the same ccw/intersect rules as the brute force version.
+# The running time is O((n + k) log n) comparisons for n lines and k
+# intersections.
+#
+# The sweep itself works with rounded floats, so it can't tell "passes
+# through this point" from "passes a hair's width away", while intersect may
+# say yes to either. So wherever the sweep compares positions it treats
+# lines within SWEEP_TOLERANCE (times the size of the coordinates) as
+# meeting, and checks all of them with intersect: at every endpoint, and at
+# every crossing, where the whole bunch of lines through that point is
+# sorted again. Extra candidates cost a call to intersect, missing one
+# changes the answer. Lines far apart along (almost) the same line are never
+# neighbors on the sweep line, so those are found by CollinearIndex.
+
+# Event kinds. When two events happen at the same point, lines that end there
+# are removed first, then crossings are swapped, then new lines are inserted.
+SWEEP_END = 0
+SWEEP_CROSS = 1
+SWEEP_START = 2
+
+# How far apart, relative to the size of the coordinates, two lines can be
+# on the sweep line and still be treated as meeting.
+SWEEP_TOLERANCE = 1e-9
+
+# Width in radians of the direction buckets used by CollinearIndex.
+COLLINEAR_ANGLE = 1e-6
+
+
+# Return the y value of a segment where it meets the vertical line at x. The
+# segment is a tuple (px, py, qx, qy) with its left endpoint first.
+# RETURN TYPE: FLOAT
+def sweep_y_at(seg, x):
+    px, py, qx, qy = seg
+    if x <= px:
+        return py
+    if x >= qx:
+        return qy
+    return py + (qy - py) * (x - px) / (qx - px)
+
+
+# Slope of a non-vertical segment, used to order lines that meet the sweep
+# line at the same point (the one going up more steeply is placed above).
+# RETURN TYPE: FLOAT
+def sweep_slope(seg):
+    px, py, qx, qy = seg
+    return (qy - py) / (qx - px)
+
+
+# True if the segment meets the vertical line at x within tol of y. A steep
+# line moves a long way up or down for a tiny step in x, so its share of the
+# tolerance grows with its slope.
+# RETURN TYPE: BOOLEAN
+def sweep_near(seg, x, y, tol):
+    return abs(sweep_y_at(seg, x) - y) <= tol * (1.0 + abs(sweep_slope(seg)))
+
+
+# Binary search the status list for the first position whose line is not
+# below the point (x, y) going out with the given slope. Lines within tol
+# of the point count as passing through it.
+# RETURN TYPE: position INTEGER
+def sweep_position(status, segs, x, y, slope, tol=0.0):
+    lo, hi = 0, len(status)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        seg = segs[status[mid]]
+        if sweep_near(seg, x, y, tol):
+            below = sweep_slope(seg) < slope
+        else:
+            below = sweep_y_at(seg, x) < y
+        if below:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+# Segments that lie along (almost) the same line can be far apart and still
+# make the float ccw tests come out as a crossing, since every point is close
+# to the other line. Neither the sweep nor a bounding box test ever puts such
+# lines together, so CollinearIndex files every line by the direction of the
+# line through it and that line's distance from the bottom left corner of
+# the data, and hands back the lines in the same or a neighboring group.
+class CollinearIndex:
+    # Build the index from the list of lines. Like SegmentGrid, the size of
+    # the groups is fixed here from the extent of the data.
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.positions = {line: i for i, line in enumerate(self.lines)}
+        self.removed = [False] * len(self.lines)
+        self.buckets = defaultdict(list)
+
+        points = [(p.x, p.y) for line in self.lines for p in (line.x1y1, line.x2y2)]
+        if points:
+            self.left = min(x for x, y in points)
+            self.bottom = min(y for x, y in points)
+            span = max(max(x - self.left, y - self.bottom) for x, y in points)
+        else:
+            self.left = self.bottom = span = 0.0
+        scale = max([1.0] + [abs(value) for point in points for value in point])
+        self.tol = SWEEP_TOLERANCE * scale
+        # Two lines whose directions differ by up to two angle buckets drift
+        # apart by up to 2 * sqrt(2) * span * COLLINEAR_ANGLE over the area
+        # the data covers, so that plus the tolerance fits in two groups.
+        self.offset = 1.5 * span * COLLINEAR_ANGLE + self.tol
+
+        for i, line in enumerate(self.lines):
+            key = self.key(line.x1y1, line.x2y2)
+            if key is not None:
+                self.buckets[key[:2]].append(i)
+
+    # The group (angle bucket, distance bucket) of the line through AB, plus
+    # the angle and distance themselves, or None for a single point.
+    # RETURN TYPE: TUPLE
+    def key(self, A, B):
+        if (A.x, A.y) > (B.x, B.y):
+            A, B = B, A
+        dx, dy = B.x - A.x, B.y - A.y
+        length = math.hypot(dx, dy)
+        if length == 0:
+            return None  # A single point never crosses anything.
+        angle = math.atan2(dy, dx)  # -pi/2 .. pi/2, since dx >= 0
+        distance = (dx * (A.y - self.bottom) - dy * (A.x - self.left)) / length
+        return (math.floor(angle / COLLINEAR_ANGLE),
+                math.floor(distance / self.offset), angle, distance)
+
+    # Positions (into self.lines) of every line still in the index that lies
+    # along almost the same line as the segment AB.
+    # RETURN TYPE: candidates LIST
+    def query(self, A, B):
+        key = self.key(A, B)
+        if key is None:
+            return []
+        angle_bucket, distance_bucket, angle, distance = key
+        # Inside the area the index was built for, the neighboring groups
+        # are enough. Further out the lines drift apart more, so look wider.
+        reach = max(math.hypot(P.x - self.left, P.y - self.bottom) for P in (A, B))
+        width = int((2 * reach * COLLINEAR_ANGLE + self.tol) / self.offset) + 1
+        groups = [(angle_bucket, distance_bucket)]
+        # A line pointing almost straight up is the same line as one pointing
+        # almost straight down, with the angle moved by pi and the distance
+        # negated, so those also look under that group.
+        if angle > math.pi / 2 - 2 * COLLINEAR_ANGLE:
+            groups.append((math.floor((angle - math.pi) / COLLINEAR_ANGLE),
+                           math.floor(-distance / self.offset)))
+        if angle < -math.pi / 2 + 2 * COLLINEAR_ANGLE:
+            groups.append((math.floor((angle + math.pi) / COLLINEAR_ANGLE),
+                           math.floor(-distance / self.offset)))
+        candidates = set()
+        for group_angle, group_distance in groups:
+            if 3 * (2 * width + 1) > len(self.buckets):
+                # Far outside a small index, it's quicker to look at every group.
+                for (other_angle, other_distance), members in self.buckets.items():
+                    if (abs(other_angle - group_angle) <= 1 and
+                            abs(other_distance - group_distance) <= width):
+                        candidates.update(members)
+                continue
+            for da in (-1, 0, 1):
+                for dd in range(-width, width + 1):
+                    candidates.update(self.buckets.get(
+                        (group_angle + da, group_distance + dd), ()))
+        return sorted(i for i in candidates if not self.removed[i])
+
+    # Take a line out of the index so later queries skip it.
+    def remove(self, line):
+        self.removed[self.positions[line]] = True
+
+    # Add a line to the index. The groups keep their size, query looks
+    # further for lines outside the area the index was built for.
+    def insert(self, line):
+        i = len(self.lines)
+        self.lines.append(line)
+        self.positions[line] = i
+        self.removed.append(False)
+        key = self.key(line.x1y1, line.x2y2)
+        if key is not None:
+            self.buckets[key[:2]].append(i)
+
+
+# Find every ordered pair (i, j) of positions into the lines list for which
+# intersect(lines[i], lines[j]) is true, with a Bentley-Ottmann sweep. Both
+# orders of a pair are tested, because rounding can make intersect say yes
+# one way round and no the other.
+# RETURN TYPE: arcs SET of TUPLES
+def sweep_line_arcs(lines):
+    # Store every line as (px, py, qx, qy) with the left endpoint first.
+    segs = []
+    for line in lines:
+        a, b = line.x1y1, line.x2y2
+        if (a.x, a.y) <= (b.x, b.y):
+            segs.append((a.x, a.y, b.x, b.y))
+        else:
+            segs.append((b.x, b.y, a.x, a.y))
+    scale = max([1.0] + [abs(value) for seg in segs for value in seg])
+    tol = SWEEP_TOLERANCE * scale
+
+    arcs = set()
+    tested = {}
+
+    # Confirm a candidate pair with intersect (both ways round) and remember
+    # the answer.
+    def test(i, j):
+        if i == j or lines[i].index == lines[j].index:
+            return False
+        key = (i, j) if i < j else (j, i)
+        found = tested.get(key)
+        if found is None:
+            a, b = lines[key[0]], lines[key[1]]
+            forward = intersect(a.x1y1, a.x2y2, b.x1y1, b.x2y2)
+            backward = intersect(b.x1y1, b.x2y2, a.x1y1, a.x2y2)
+            if forward:
+                arcs.add(key)
+            if backward:
+                arcs.add((key[1], key[0]))
+            found = tested[key] = forward or backward
+        return found
+
+    collinear = CollinearIndex(lines)
+    for i, line in enumerate(lines):
+        for j in collinear.query(line.x1y1, line.x2y2):
+            if i < j:
+                test(i, j)
+
+    # Lines that share an endpoint are removed and inserted at the same event,
+    # so they may never be neighbors on the sweep line. Check them directly.
+    endpoints = defaultdict(list)
+    for i, seg in enumerate(segs):
+        endpoints[(seg[0], seg[1])].append(i)
+        if (seg[2], seg[3]) != (seg[0], seg[1]):
+            endpoints[(seg[2], seg[3])].append(i)
+    for group in endpoints.values():
+        for a in range(len(group)):
+            for b in range(a + 1, len(group)):
+                test(group[a], group[b])
+
+    # The event schedule is a heap ordered by (x, y, kind).
+    events = []
+    for i, seg in enumerate(segs):
+        events.append((seg[0], seg[1], SWEEP_START, i, -1))
+        events.append((seg[2], seg[3], SWEEP_END, i, -1))
+    heapq.heapify(events)
+
+    # The status holds the lines currently cut by the sweep line, bottom to top.
+    status = []
+    active = set()
+
+    # Check two neighbors (lower below upper). If they cross ahead of the sweep
+    # line, schedule the point where they swap places.
+    def check_neighbors(lower, upper, x):
+        if not test(lower, upper):
+            return
+        if sweep_slope(segs[lower]) <= sweep_slope(segs[upper]):
+            return  # They are moving apart, so they have already crossed.
+        # Solve lower(t) = upper(s) with cross products rather than slopes,
+        # which keeps the crossing exact when the inputs are on a grid.
+        l_px, l_py, l_qx, l_qy = segs[lower]
+        u_px, u_py, u_qx, u_qy = segs[upper]
+        rx, ry = l_qx - l_px, l_qy - l_py
+        sx, sy = u_qx - u_px, u_qy - u_py
+        t = ((u_px - l_px) * sy - (u_py - l_py) * sx) / (rx * sy - ry * sx)
+        cross_x = max(x, l_px + t * rx)
+        heapq.heappush(events, (cross_x, sweep_y_at(segs[lower], cross_x),
+                                SWEEP_CROSS, lower, upper))
+
+    # Vertical lines are never placed in the status. Instead they are checked
+    # against every line that meets the sweep line between their endpoints,
+    # once when they start and once when they end.
+    def check_vertical(i, x):
+        py, qy = segs[i][1], segs[i][3]
+        pos = sweep_position(status, segs, x, py - tol, float('-inf'))
+        while pos > 0 and sweep_near(segs[status[pos - 1]], x, py, tol):
+            pos = pos - 1
+        while pos < len(status) and (
+                sweep_y_at(segs[status[pos]], x) <= qy + tol or
+                sweep_near(segs[status[pos]], x, qy, tol)):
+            test(i, status[pos])
+            pos = pos + 1
+
+    # The positions lo..hi of the lines that meet the sweep line at (x, y),
+    # found by walking out from pos.
+    def through_point(pos, x, y):
+        lo = pos
+        while lo > 0 and sweep_near(segs[status[lo - 1]], x, y, tol):
+            lo = lo - 1
+        hi = pos
+        while hi + 1 < len(status) and sweep_near(segs[status[hi + 1]], x, y, tol):
+            hi = hi + 1
+        return lo, hi
+
+    # Several lines can pass through the same event point, and only two of
+    # them are neighbors of a line that starts or ends there. Check the line
+    # at pos against all of them.
+    def check_through_point(i, pos, x, y):
+        lo, hi = through_point(pos, x, y)
+        for other in status[lo:hi + 1]:
+            test(i, other)
+
+    while events:
+        x, y, kind, a, b = heapq.heappop(events)
+        seg = segs[a]
+
+        if seg[0] == seg[2]:
+            # Vertical line (or a single point).
+            if kind != SWEEP_CROSS:
+                check_vertical(a, x)
+
+        elif kind == SWEEP_START:
+            pos = sweep_position(status, segs, x, y, sweep_slope(seg), tol)
+            status.insert(pos, a)
+            active.add(a)
+            check_through_point(a, pos, x, y)
+            if pos > 0:
+                check_neighbors(status[pos - 1], a, x)
+            if pos + 1 < len(status):
+                check_neighbors(a, status[pos + 1], x)
+
+        elif kind == SWEEP_END:
+            pos = status.index(a)
+            check_through_point(a, pos, x, y)
+            status.pop(pos)
+            active.discard(a)
+            if 0 < pos < len(status):
+                check_neighbors(status[pos - 1], status[pos], x)
+
+        else:
+            # A crossing is only still valid if both lines are active and a is
+            # still below b. Otherwise a later event has replaced it.
+            if a not in active or b not in active:
+                continue
+            pos = status.index(a)
+            lo, hi = through_point(pos, x, y)
+            bunch = status[lo:hi + 1]
+            if b in bunch[:pos - lo]:
+                continue
+            if b in bunch:
+                # Every line through the crossing point is checked against the
+                # others, and then they leave it in order of slope.
+                for m in range(len(bunch)):
+                    for n in range(m + 1, len(bunch)):
+                        test(bunch[m], bunch[n])
+                bunch.sort(key=lambda i: sweep_slope(segs[i]))
+                status[lo:hi + 1] = bunch
+            elif pos + 1 < len(status) and status[pos + 1] == b:
+                lo, hi = pos, pos + 1
+                status[pos], status[pos + 1] = b, a
+            else:
+                continue
+            if lo > 0:
+                check_neighbors(status[lo - 1], status[lo], x)
+            if hi + 1 < len(status):
+                check_neighbors(status[hi], status[hi + 1], x)
+
+    return arcs
+
+
+# The same search as sweep_line_arcs, giving each crossing pair once as
+# positions (i, j) with i < j.
+# RETURN TYPE: pairs SET of TUPLES
+def sweep_line_pairs(lines):
+    return {(i, j) if i < j else (j, i) for i, j in sweep_line_arcs(lines)}
+
+
+# Count the intersections of every line in one sweep. This gives the same
+# numbers as calling check_line on each line, keyed by the line's index.
+# RETURN TYPE: counts DICTIONARY
+def sweep_line_counts(lines):
+    counts = defaultdict(int)
+    for line in lines:
+        counts[line.index] = 0
+    for i, j in sweep_line_arcs(lines):
+        counts[lines[i].index] += 1
+    return counts
+
+
+# The pure Python ccw/intersect above pay for a function call and four
+# attribute lookups per point, millions of times in check_line. The NumPy
+# kernel below does the same orientation tests on whole arrays of lines at
+# once. It uses the same formula in the same float64 arithmetic, so it gives
+# exactly the same answers; the Python version stays as the reference.
+
+# Put the endpoints of every line into an (n, 4) array of x1, y1, x2, y2.
+# RETURN TYPE: NUMPY ARRAY
+def segment_array(lines):
+    if np is None:
+        raise ImportError("the 'numpy' backend needs NumPy installed")
+    if isinstance(lines, SegmentStore):
+        return np.column_stack([np.frombuffer(column, dtype=np.float64)
+                                for column in (lines.x1, lines.y1, lines.x2, lines.y2)])
+    segs = np.empty((len(lines), 4), dtype=np.float64)
+    for i, line in enumerate(lines):
+        segs[i] = (line.x1y1.x, line.x1y1.y, line.x2y2.x, line.x2y2.y)
+    return segs
+
+
+# Vectorized ccw: the same test as ccw(A, B, C) on arrays of coordinates.
+# RETURN TYPE: BOOLEAN ARRAY
+def batch_ccw(ax, ay, bx, by, cx, cy):
+    return (cy-ay)*(bx-ax) > (by-ay)*(cx-ax)
+
+
+# Vectorized intersect for every line in rows against every line in cols.
+# Both are (m, 4) and (k, 4) arrays and the answer is an (m, k) array.
+# RETURN TYPE: BOOLEAN ARRAY
+def batch_intersect(rows, cols):
+    ax, ay = rows[:, 0, None], rows[:, 1, None]
+    bx, by = rows[:, 2, None], rows[:, 3, None]
+    cx, cy = cols[None, :, 0], cols[None, :, 1]
+    dx, dy = cols[None, :, 2], cols[None, :, 3]
+    return ((batch_ccw(ax, ay, cx, cy, dx, dy) != batch_ccw(bx, by, cx, cy, dx, dy)) &
+            (batch_ccw(ax, ay, bx, by, cx, cy) != batch_ccw(ax, ay, bx, by, dx, dy)))
+
+
+# batch_ccw with the same float filter as ccw_filtered_xy: the few entries
+# inside the error band are done again exactly, one by one.
+# RETURN TYPE: BOOLEAN ARRAY
+def batch_ccw_filtered(ax, ay, bx, by, cx, cy):
+    left = (cy-ay)*(bx-ax)
+    right = (by-ay)*(cx-ax)
+    det = left - right
+    bound = CCW_ERROR_BOUND * (np.abs(left) + np.abs(right))
+    result = det > bound
+    unsure = np.abs(det) <= bound
+    if unsure.any():
+        points = np.broadcast_arrays(ax, ay, bx, by, cx, cy)
+        for where in zip(*np.nonzero(unsure)):
+            result[where] = ccw_exact_xy(*[float(p[where]) for p in points])
+        if stats is not None:
+            stats['counters']['exact_ccw'] += int(unsure.sum())
+    return result
+
+
+# Count the intersections of every line, one tile of rows at a time so the
+# (tile, n) boolean matrix stays small. Lines are never counted against
+# lines with the same index, just like check_line.
+# RETURN TYPE: counts DICTIONARY
+def batch_line_counts(lines, tile=256):
+    segs = segment_array(lines)
+    indexes = np.array([line.index for line in lines])
+    counts = defaultdict(int)
+    for start in range(0, len(lines), tile):
+        stop = min(start + tile, len(lines))
+        hits = batch_intersect(segs[start:stop], segs)
+        hits &= indexes[start:stop, None] != indexes[None, :]
+        for line, count in zip(lines[start:stop], hits.sum(axis=1)):
+            counts[line.index] = int(count)
+    return counts
+
+
+# Find every (i, j) with intersect(lines[i], lines[j]) true, with the
+# batched kernel. Both orders are tested, since rounding can make intersect
+# say yes one way round and no the other.
+# RETURN TYPE: arcs LIST of TUPLES
+def batch_line_arcs(lines, tile=256):
+    segs = segment_array(lines)
+    indexes = np.array([line.index for line in lines])
+    arcs = []
+    for start in range(0, len(lines), tile):
+        stop = min(start + tile, len(lines))
+        hits = batch_intersect(segs[start:stop], segs)
+        hits &= indexes[start:stop, None] != indexes[None, :]
+        for i, j in zip(*np.nonzero(hits)):
+            arcs.append((start + int(i), int(j)))
+    return arcs
+
+
+# Our inputs are clustered in a small lat/long box, and most pairs of lines
+# are nowhere near each other. Two lines whose bounding boxes don't overlap
+# can only intersect (as far as the float intersect is concerned) if they lie
+# along almost the same line, so we don't need to call intersect on the rest.
+# SegmentGrid splits the extent of the data into about n square-ish cells
+# and files every line under each cell its bounding box touches. Asking
+# "which lines could intersect this segment" then only has to look at the
+# cells under the segment's own bounding box, plus a CollinearIndex.
+class SegmentGrid:
+    # Build the grid once from the list of lines. cells_per_side defaults to
+    # about sqrt(n), so there is roughly one line per cell.
+    def __init__(self, lines, cells_per_side=None):
+        self.lines = list(lines)
+        self.positions = {line: i for i, line in enumerate(self.lines)}
+        self.removed = [False] * len(self.lines)
+        self.boxes = [line_box(line) for line in self.lines]
+        self.cells = defaultdict(list)
+
+        if cells_per_side is None:
+            cells_per_side = max(1, int(math.ceil(math.sqrt(len(self.lines)))))
+        self.cells_per_side = cells_per_side
+
+        # The extent of the data, and the size of one cell in each direction.
+        if self.boxes:
+            self.min_x = min(box[0] for box in self.boxes)
+            self.min_y = min(box[1] for box in self.boxes)
+            max_x = max(box[2] for box in self.boxes)
+            max_y = max(box[3] for box in self.boxes)
+        else:
+            self.min_x = self.min_y = max_x = max_y = 0.0
+        self.cell_w = (max_x - self.min_x) / cells_per_side or 1.0
+        self.cell_h = (max_y - self.min_y) / cells_per_side or 1.0
+
+        for i, box in enumerate(self.boxes):
+            for cell in self.cell_range(box):
+                self.cells[cell].append(i)
+        self.collinear = CollinearIndex(self.lines)
+
+    # Turn a coordinate into a cell number, clamped to the grid.
+    def cell_of(self, value, low, size):
+        cell = int((value - low) / size)
+        return min(max(cell, 0), self.cells_per_side - 1)
+
+    # Every (column, row) cell that the bounding box touches.
+    def cell_range(self, box):
+        x_low = self.cell_of(box[0], self.min_x, self.cell_w)
+        x_high = self.cell_of(box[2], self.min_x, self.cell_w)
+        y_low = self.cell_of(box[1], self.min_y, self.cell_h)
+        y_high = self.cell_of(box[3], self.min_y, self.cell_h)
+        for cx in range(x_low, x_high + 1):
+            for cy in range(y_low, y_high + 1):
+                yield (cx, cy)
+
+    # Positions (into self.lines) of every line still in the grid whose
+    # bounding box overlaps the bounding box of the segment AB, or that lies
+    # along almost the same line. These are the only lines that could
+    # intersect AB.
+    # RETURN TYPE: candidates LIST
+    def query(self, A, B):
+        box = (min(A.x, B.x), min(A.y, B.y), max(A.x, B.x), max(A.y, B.y))
+        candidates = self.collinear.query(A, B)
+        seen = set(candidates)
+        for cell in self.cell_range(box):
+            for i in self.cells.get(cell, ()):
+                if i in seen or self.removed[i]:
+                    continue
+                seen.add(i)
+                if boxes_overlap(box, self.boxes[i]):
+                    candidates.append(i)
+        candidates.sort()
+        return candidates
+
+    # The lines (not positions) that could intersect this line, not counting
+    # the line itself.
+    # RETURN TYPE: candidates LIST of objects
+    def candidates(self, line):
+        return [self.lines[i] for i in self.query(line.x1y1, line.x2y2)
+                if self.lines[i] is not line]
+
+    # Take a line out of the grid so later queries skip it.
+    def remove(self, line):
+        self.removed[self.positions[line]] = True
+        self.collinear.remove(line)
+
+    # Add a line to the grid. The cells keep their size, so a line outside
+    # the area the grid was built for lands in the cells along its edge.
+    def insert(self, line):
+        i = len(self.lines)
+        self.lines.append(line)
+        self.positions[line] = i
+        self.removed.append(False)
+        box = line_box(line)
+        self.boxes.append(box)
+        for cell in self.cell_range(box):
+            self.cells[cell].append(i)
+        self.collinear.insert(line)
+
+
+# Bounding box (min x, min y, max x, max y) of a line.
+# RETURN TYPE: TUPLE
+def line_box(line):
+    a, b = line.x1y1, line.x2y2
+    return (min(a.x, b.x), min(a.y, b.y), max(a.x, b.x), max(a.y, b.y))
+
+
+# Two boxes overlap if they overlap on both axes (touching counts).
+# RETURN TYPE: BOOLEAN
+def boxes_overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+# Count the intersections of every line, only calling intersect on the
+# candidates from the grid. Lines removed from the grid are not counted.
+# RETURN TYPE: counts DICTIONARY
+def grid_line_counts(lines, grid=None):
+    if grid is None:
+        grid = SegmentGrid(lines)
+    counts = defaultdict(int)
+    for line in lines:
+        count = 0
+        for other in grid.candidates(line):
+            if line.index != other.index and intersect(
+                    line.x1y1, line.x2y2, other.x1y1, other.x2y2):
+                count = count + 1
+        counts[line.index] = count
+    return counts
+
+
+# Find every (i, j) with intersect(lines[i], lines[j]) true, using the grid
+# for candidates. Both orders are tested, like batch_line_arcs.
+# RETURN TYPE: arcs LIST of TUPLES
+def grid_line_arcs(lines):
+    grid = SegmentGrid(lines)
+    arcs = []
+    for i, line in enumerate(lines):
+        for j in grid.query(line.x1y1, line.x2y2):
+            if line.index != lines[j].index and intersect(
+                    line.x1y1, line.x2y2, lines[j].x1y1, lines[j].x2y2):
+                arcs.append((i, j))
+    return arcs
+
+
+# Counting the intersections of every line is the same job done n times, so
+# it can be split across CPU cores. ParallelCounter copies the coordinates
+# into one block of shared memory, which every worker process maps once when
+# it starts, so no Line objects are ever pickled. The lines are cut into
+# tiles of rows; each worker counts its tile against all the lines and sends
+# back just a list of numbers (or crossing pairs), which we merge.
+#
+# Shared block layout for n lines:
+#   x1[n], y1[n], x2[n], y2[n]  doubles
+#   index[n]                    64-bit ints
+#   alive[n]                    bytes, 0 once a line has been removed
+
+# What each worker process keeps after attaching to the shared block.
+parallel_state = {}
+
+
+# Pool initializer: attach to the shared block and make typed views of it
+# (and use the filtered predicates too if the parent process does).
+def parallel_worker_init(name, n, filtered=False):
+    if filtered:
+        use_filtered_predicates()
+    block = shared_memory.SharedMemory(name=name)
+    buf = block.buf
+    parallel_state['block'] = block
+    parallel_state['n'] = n
+    parallel_state['coords'] = buf[:32 * n].cast('d')
+    parallel_state['index'] = buf[32 * n:40 * n].cast('q')
+    parallel_state['alive'] = buf[40 * n:41 * n]
+
+
+# Count the intersections of every live line in rows start..stop against
+# every other live line.
+# RETURN TYPE: counts LIST
+def parallel_count_tile(start, stop):
+    n = parallel_state['n']
+    coords, index, alive = (parallel_state['coords'], parallel_state['index'],
+                            parallel_state['alive'])
+    x1, y1 = coords[0:n], coords[n:2 * n]
+    x2, y2 = coords[2 * n:3 * n], coords[3 * n:4 * n]
+    counts = []
+    for row in range(start, stop):
+        count = 0
+        if alive[row]:
+            ax, ay, bx, by = x1[row], y1[row], x2[row], y2[row]
+            line_index = index[row]
+            for other in range(n):
+                if alive[other] and index[other] != line_index and intersect_xy(
+                        ax, ay, bx, by, x1[other], y1[other], x2[other], y2[other]):
+                    count = count + 1
+        counts.append(count)
+    return counts
+
+
+# Find every (i, j) with intersect(lines[i], lines[j]) true whose first
+# line is in rows start..stop.
+# RETURN TYPE: arcs LIST of TUPLES
+def parallel_arcs_tile(start, stop):
+    n = parallel_state['n']
+    coords, index = parallel_state['coords'], parallel_state['index']
+    x1, y1 = coords[0:n], coords[n:2 * n]
+    x2, y2 = coords[2 * n:3 * n], coords[3 * n:4 * n]
+    arcs = []
+    for row in range(start, stop):
+        ax, ay, bx, by = x1[row], y1[row], x2[row], y2[row]
+        for other in range(n):
+            if index[other] != index[row] and intersect_xy(
+                    ax, ay, bx, by, x1[other], y1[other], x2[other], y2[other]):
+                arcs.append((row, other))
+    return arcs
+
+
+# Shut the pool down and remove the shared block from the system.
+def parallel_cleanup(pool, block):
+    pool.terminate()
+    pool.join()
+    block.unlink()
+
+
+class ParallelCounter:
+    # Copy the lines into shared memory and start the worker pool. workers
+    # defaults to the number of CPUs; tile is the number of rows per task.
+    def __init__(self, lines, workers=None, tile=None):
+        if shared_memory is None:
+            raise ImportError("the 'parallel' backend needs Python 3.8 or newer")
+        self.lines = list(lines)
+        self.positions = {line: i for i, line in enumerate(self.lines)}
+        n = len(self.lines)
+        self.workers = workers or multiprocessing.cpu_count()
+        self.tile = tile or max(1, -(-n // (self.workers * 4)))
+
+        # A zero-size block is not allowed, so always ask for at least a byte.
+        self.block = shared_memory.SharedMemory(create=True, size=max(1, 41 * n))
+        buf = self.block.buf
+        coords = buf[:32 * n].cast('d')
+        for i, line in enumerate(self.lines):
+            coords[i] = line.x1y1.x
+            coords[n + i] = line.x1y1.y
+            coords[2 * n + i] = line.x2y2.x
+            coords[3 * n + i] = line.x2y2.y
+        coords.release()
+        index = buf[32 * n:40 * n].cast('q')
+        for i, line in enumerate(self.lines):
+            index[i] = line.index
+        index.release()
+        self.alive = buf[40 * n:41 * n]
+        self.alive[:] = b'\x01' * n
+
+        self.pool = multiprocessing.Pool(self.workers, parallel_worker_init,
+                                         (self.block.name, n, filtered_predicates))
+        self.finalizer = weakref.finalize(self, parallel_cleanup,
+                                          self.pool, self.block)
+
+    # The (start, stop) row ranges handed to the workers.
+    def tiles(self):
+        n = len(self.lines)
+        return [(start, min(start + self.tile, n))
+                for start in range(0, n, self.tile)]
+
+    # Count the intersections of every line still alive, keyed by index.
+    # RETURN TYPE: counts DICTIONARY
+    def counts(self):
+        counts = defaultdict(int)
+        tiles = self.tiles()
+        results = self.pool.starmap(parallel_count_tile, tiles)
+        for (start, stop), tile_counts in zip(tiles, results):
+            for row, count in zip(range(start, stop), tile_counts):
+                if self.alive[row]:
+                    counts[self.lines[row].index] = count
+        return counts
+
+    # Every (i, j) with intersect(lines[i], lines[j]) true (ignores removals).
+    # RETURN TYPE: arcs LIST of TUPLES
+    def arcs(self):
+        arcs = []
+        for tile_arcs in self.pool.starmap(parallel_arcs_tile, self.tiles()):
+            arcs.extend(tile_arcs)
+        return arcs
+
+    # Mark a line as removed so the workers stop counting it.
+    def remove(self, line):
+        self.alive[self.positions[line]] = 0
+
+    # Stop the workers and free the shared memory.
+    def close(self):
+        self.finalizer()
+        self.alive.release()
+        self.block.close()
+
+
 # Use the above function to find all lines that don't have intersections.
+# The backend is 'brute' (check_line against every line), 'sweep' (one
+# sweep_line_counts pass per round), 'numpy' (one batch_line_counts pass
+# per round), 'grid' (a SegmentGrid built once; removed lines are taken out
+# of it so every round only looks at nearby lines that are left) or
+# 'parallel' (a ParallelCounter with the given number of workers). With
+# incremental=True the work is handed to check_intersections_incremental,
+# which gives the same answer.
 # RETURN TYPE: lines_without_intersections LIST
-def check_intersections(lines):
+def check_intersections(lines, backend='brute', incremental=False, workers=None):
+    # A SegmentStore is worked on through one LineView per row. Lines are
+    # removed from this list as we go, the store itself is left alone.
+    if isinstance(lines, SegmentStore):
+        lines = list(lines)
+    
+    if incremental:
+        return check_intersections_incremental(lines, backend, workers)
     
     # List for holding every line that doesn't have intersection(s).
     lines_without_intersections = []
     
+    # The grid backend builds its spatial index once for every round.
+    grid = SegmentGrid(lines) if backend == 'grid' else None
+    
+    # The parallel backend shares the lines with its workers once as well.
+    counter = ParallelCounter(lines, workers) if backend == 'parallel' else None
+    
     # The lines list must not be empty.
     while len(lines) > 0:
+        if stats is not None:
+            stats['counters']['removal_rounds'] += 1
+
 		# Used to find the high intersection for a line in a set.
         max_intersections = 0
 		
 		# Once we have found that line, store it in this variable.
         max_line = None  # Empty or no value here
     
+        # With the sweep or numpy backend, count every line's intersections at once.
+        counts = None
+        with phase('count'):
+            if backend == 'sweep':
+                counts = sweep_line_counts(lines)
+            elif backend == 'numpy':
+                counts = batch_line_counts(lines)
+            elif backend == 'grid':
+                counts = grid_line_counts(lines, grid)
+            elif backend == 'parallel':
+                counts = counter.counts()
+    
         # Look for intersections.
         for line in lines:
 			# Check each line and store its # of intersections in this variable.
-            count_intersection = check_line(line, lines)
+            count_intersection = check_line(line, lines, counts)
     
             # If there are no intersections found for a given line, add the line 
             # number to the "lines_without_intersections" list.
@@ -173,6 +1251,10 @@ def check_intersections(lines):
         # We remove the line that has the max number of intersections.
         if max_line:
             lines.remove(max_line)
+            if grid:
+                grid.remove(max_line)
+            if counter:
+                counter.remove(max_line)
     
         # As we are iterating through the lines_without_intersections list, if we
 		# find a line that is also in the lines argument, then we remove it and 
@@ -181,9 +1263,396 @@ def check_intersections(lines):
         for line in lines_without_intersections:
             if line in lines:
                 lines.remove(line)
+                if grid:
+                    grid.remove(line)
+                if counter:
+                    counter.remove(line)
+    
+    if counter:
+        counter.close()
     return lines_without_intersections
 
 
+# Build the intersection graph of the lines once: neighbors[i] lists the
+# positions of every line j with intersect(lines[i], lines[j]) true, which
+# is what check_line counts for lines[i]. With floats, intersect can give a
+# different answer with the two lines swapped, so this is a directed graph.
+# The crossings come from the sweep-line engine, the NumPy kernel, the
+# spatial grid, or from comparing every pair with the 'brute' backend
+# ('parallel' splits that over workers).
+# RETURN TYPE: neighbors LIST of LISTS
+def intersection_graph(lines, backend='sweep', workers=None):
+    neighbors = [[] for line in lines]
+
+    if backend == 'sweep':
+        arcs = sweep_line_arcs(lines)
+    elif backend == 'numpy':
+        arcs = batch_line_arcs(lines)
+    elif backend == 'grid':
+        arcs = grid_line_arcs(lines)
+    elif backend == 'parallel':
+        counter = ParallelCounter(lines, workers)
+        arcs = counter.arcs()
+        counter.close()
+    else:
+        arcs = []
+        for i in range(len(lines)):
+            for j in range(len(lines)):
+                if lines[i].index != lines[j].index and intersect(
+                        lines[i].x1y1, lines[i].x2y2, lines[j].x1y1, lines[j].x2y2):
+                    arcs.append((i, j))
+
+    for i, j in arcs:
+        neighbors[i].append(j)
+    return neighbors
+
+
+# Same greedy as check_intersections, but the intersections are only found
+# once. Every round of check_intersections recounts every remaining line,
+# which is O(n^3) calls to intersect overall. Here we keep each line's
+# degree (what check_line would count for it among the lines still left)
+# and update only the lines whose count includes a line we take out.
+#
+# To pick exactly the same lines as check_intersections:
+#   - lines with no crossings are reported round by round, in list order.
+#   - the removed line is the one with the most crossings, and on a tie the
+#     one that comes last in the list (that is what the ">=" does).
+#   - the lines reported in a round are taken out after that pick, so they
+#     still count for the others until the next round. (A line can have no
+#     crossings of its own and still be counted by another line, when
+#     intersect says yes only one way round.)
+# The max-heap holds (-degree, -position) so the top is that line. When a
+# degree changes we push a new entry and skip the old one when it comes up.
+# RETURN TYPE: lines_without_intersections LIST
+def check_intersections_incremental(lines, backend='sweep', workers=None):
+    with phase('intersection_graph'):
+        neighbors = intersection_graph(lines, backend, workers)
+    degree = [len(adjacent) for adjacent in neighbors]
+    removed = [False] * len(lines)
+
+    # counted_by[j] lists the lines whose degree counts line j.
+    counted_by = [[] for line in lines]
+    for i, adjacent in enumerate(neighbors):
+        for j in adjacent:
+            counted_by[j].append(i)
+
+    heap = [(-degree[i], -i) for i in range(len(lines)) if degree[i] > 0]
+    heapq.heapify(heap)
+
+    lines_without_intersections = []
+    zero_degree = [i for i in range(len(lines)) if degree[i] == 0]
+    remaining = len(lines)
+
+    while remaining > 0:
+        if stats is not None:
+            stats['counters']['removal_rounds'] += 1
+
+        # Every line with no crossings this round is kept.
+        kept = sorted(zero_degree)
+        for i in kept:
+            lines_without_intersections.append(lines[i])
+            removed[i] = True
+        remaining = remaining - len(kept)
+        zero_degree = []
+
+        # Find the line with the most crossings, skipping stale entries, and
+        # take it out too.
+        taken_out = kept
+        while heap:
+            neg_degree, neg_pos = heapq.heappop(heap)
+            max_pos = -neg_pos
+            if not removed[max_pos] and degree[max_pos] == -neg_degree:
+                removed[max_pos] = True
+                remaining = remaining - 1
+                taken_out = [max_pos] + kept
+                break
+
+        # Update the degrees of the lines that counted the lines taken out.
+        for j in taken_out:
+            for i in counted_by[j]:
+                if not removed[i]:
+                    degree[i] = degree[i] - 1
+                    if degree[i] == 0:
+                        zero_degree.append(i)
+                    else:
+                        heapq.heappush(heap, (-degree[i], -i))
+
+        if not heap and not zero_degree:
+            break
+
+    return lines_without_intersections
+
+
+
+# A set of lines that changes a few at a time, with the answer of
+# check_intersections kept up to date: insert(line) and remove(index) change
+# the set, and result() gives what check_intersections would return for the
+# lines still in the set, in the order they were inserted.
+#
+# Why this can be done locally: the greedy only looks at the intersection
+# graph. Every round it takes out the line with the most crossings (on a
+# tie, the one that comes last), and the lines left with no crossings are
+# kept. The line picked is always also the best one of its own connected
+# group of crossing lines, so each group goes through exactly the same
+# steps as it would on its own. So we keep, for each group, which lines the
+# greedy keeps, and after a change only redo the groups the changed line
+# was in (inserting can join groups, removing can split one).
+#
+# The order of result() is the order check_intersections reports lines in:
+# round by round, and by position within a round. A line is reported the
+# round after the removal that left it with no crossings (lines with none
+# to begin with in round 1). Removals happen in order of (crossings,
+# position), largest first, across all groups, so sorting by the key of
+# that removal gives the rounds.
+#
+# The exception is a group where intersect says yes for a pair only one way
+# round (see intersection_graph). A kept line there can still count for
+# another line until the end of its round, so the group's steps depend on
+# which rounds the other groups use. Those groups are solved in result(),
+# round by round, next to the removals of all the other groups.
+#
+# Crossings are found with intersect through a SegmentGrid, so inserting a
+# line only tests lines near it.
+class SegmentSet:
+    def __init__(self, lines=()):
+        self.lines = {}          # position -> line (positions count up)
+        self.position = {}       # line index -> position
+        self.crosses = {}        # position -> positions of the lines it crosses
+        self.crossed_by = {}     # position -> positions of the lines crossing it
+        self.group = {}          # position -> group number
+        self.members = {}        # group number -> set of positions
+        self.removals = {}       # group number -> keys of its removals
+        self.one_way = set()     # groups with a pair that crosses one way only
+        self.kept = {}           # kept position -> key of the removal that freed it
+        self.next_position = 0
+        self.next_group = 0
+        self.cached = None
+
+        lines = list(lines)
+        for line in lines:
+            self.add_line(line)
+        self.grid = SegmentGrid(lines)
+        self.grid_size = len(lines)
+        for pos, line in self.lines.items():
+            for other in self.crossing(line):
+                other_pos = self.position[other.index]
+                self.crosses[pos].add(other_pos)
+                self.crossed_by[other_pos].add(pos)
+        # Split everything into groups and run the greedy on each one.
+        self.regroup(set(self.lines))
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __contains__(self, index):
+        return index in self.position
+
+    # The lines in the set, in the order they were inserted.
+    # RETURN TYPE: LIST of objects
+    def current_lines(self):
+        return [self.lines[pos] for pos in sorted(self.lines)]
+
+    # Give a line the next position (no crossings yet).
+    def add_line(self, line):
+        if line.index in self.position:
+            raise ValueError('a line with index %r is already in the set' % (line.index,))
+        pos = self.next_position
+        self.next_position = pos + 1
+        self.lines[pos] = line
+        self.position[line.index] = pos
+        self.crosses[pos] = set()
+        self.crossed_by[pos] = set()
+        return pos
+
+    # The lines in the grid that line crosses (same test as check_line). The
+    # grid's candidates include far apart lines along almost the same line,
+    # which the float intersect can still say cross it.
+    # RETURN TYPE: LIST of objects
+    def crossing(self, line):
+        return [other for other in self.grid.candidates(line)
+                if other.index != line.index and
+                intersect(line.x1y1, line.x2y2, other.x1y1, other.x2y2)]
+
+    # Add a line and update the answer for its group.
+    def insert(self, line):
+        pos = self.add_line(line)
+        if not self.rebuild_grid():
+            self.grid.insert(line)
+        touched = {pos}
+        for other in self.grid.candidates(line):
+            if other.index == line.index:
+                continue
+            other_pos = self.position[other.index]
+            if intersect(line.x1y1, line.x2y2, other.x1y1, other.x2y2):
+                self.crosses[pos].add(other_pos)
+                self.crossed_by[other_pos].add(pos)
+            if intersect(other.x1y1, other.x2y2, line.x1y1, line.x2y2):
+                self.crosses[other_pos].add(pos)
+                self.crossed_by[pos].add(other_pos)
+            if other_pos in self.crosses[pos] or other_pos in self.crossed_by[pos]:
+                touched.update(self.members[self.group[other_pos]])
+        self.regroup(touched)
+
+    # Remove the line with this index and update the answer for its group.
+    def remove(self, index):
+        pos = self.position.pop(index)
+        line = self.lines.pop(pos)
+        if not self.rebuild_grid():
+            self.grid.remove(line)
+        for other_pos in self.crosses.pop(pos):
+            self.crossed_by[other_pos].discard(pos)
+        for other_pos in self.crossed_by.pop(pos):
+            self.crosses[other_pos].discard(pos)
+        touched = self.members[self.group.pop(pos)]
+        touched.discard(pos)
+        self.kept.pop(pos, None)
+        self.regroup(touched)
+
+    # Build a new grid from the lines in the set once it has grown to twice
+    # the size the grid was built for, or the grid holds as many removed
+    # lines as live ones, so the cells stay small. True if it was rebuilt.
+    # RETURN TYPE: BOOLEAN
+    def rebuild_grid(self):
+        live = max(len(self.lines), 8)
+        if live > 2 * max(self.grid_size, 8) or len(self.grid.lines) > 2 * live:
+            self.grid = SegmentGrid(self.current_lines())
+            self.grid_size = len(self.lines)
+            return True
+        return False
+
+    # Split the positions into groups of crossing lines again (they were
+    # whole groups, or a group minus a removed line) and redo their greedy.
+    def regroup(self, positions):
+        for pos in positions:
+            number = self.group.get(pos)
+            self.members.pop(number, None)
+            self.removals.pop(number, None)
+            self.one_way.discard(number)
+        left = set(positions)
+        while left:
+            start = left.pop()
+            members = {start}
+            stack = [start]
+            while stack:
+                pos = stack.pop()
+                for other in self.crosses[pos] | self.crossed_by[pos]:
+                    if other not in members:
+                        members.add(other)
+                        stack.append(other)
+            left -= members
+            number = self.next_group
+            self.next_group = number + 1
+            self.members[number] = members
+            for pos in members:
+                self.group[pos] = number
+                self.kept.pop(pos, None)
+            if any(self.crosses[pos] != self.crossed_by[pos] for pos in members):
+                self.one_way.add(number)
+            else:
+                self.removals[number] = self.solve(members)
+        self.cached = None
+
+    # The greedy of check_intersections_incremental on one group: remember
+    # which lines are kept, and the (crossings, position) of the removal that
+    # left each of them with no crossings (None if it never had any).
+    # RETURN TYPE: keys of the removals LIST of TUPLES
+    def solve(self, members):
+        degree = {}
+        heap = []
+        for pos in members:
+            degree[pos] = len(self.crosses[pos])
+            if degree[pos] == 0:
+                self.kept[pos] = None
+            else:
+                heap.append((-degree[pos], -pos))
+        heapq.heapify(heap)
+        removed = set()
+        removals = []
+        while heap:
+            neg_degree, neg_pos = heapq.heappop(heap)
+            pos = -neg_pos
+            if pos in removed or degree[pos] != -neg_degree:
+                continue
+            removed.add(pos)
+            key = (-neg_degree, pos)
+            removals.append(key)
+            for other in self.crossed_by[pos]:
+                if other not in removed:
+                    degree[other] = degree[other] - 1
+                    if degree[other] == 0:
+                        self.kept[other] = key
+                    else:
+                        heapq.heappush(heap, (-degree[other], -other))
+        return removals
+
+    # Run the greedy round by round on the groups in self.one_way, like
+    # check_intersections_incremental does. In a round where one of the
+    # other groups has a better removal than these groups, that removal is
+    # the one made. Gives the kept positions of these groups, with the key
+    # of the removal made the round before they were reported.
+    # RETURN TYPE: kept DICTIONARY
+    def solve_one_way(self):
+        others = sorted((key for removals in self.removals.values()
+                         for key in removals), reverse=True)
+        members = set()
+        for number in self.one_way:
+            members.update(self.members[number])
+        degree = {pos: len(self.crosses[pos]) for pos in members}
+        heap = [(-degree[pos], -pos) for pos in members if degree[pos] > 0]
+        heapq.heapify(heap)
+        zero_degree = [pos for pos in members if degree[pos] == 0]
+        removed = set()
+        kept = {}
+        last_key = None
+        next_other = 0
+        while len(removed) < len(members):
+            for pos in zero_degree:
+                kept[pos] = last_key
+                removed.add(pos)
+            taken_out = zero_degree
+            zero_degree = []
+
+            # The best removal left in these groups.
+            while heap and (-heap[0][1] in removed or
+                            degree[-heap[0][1]] != -heap[0][0]):
+                heapq.heappop(heap)
+            if heap and (next_other == len(others) or
+                         (-heap[0][0], -heap[0][1]) > others[next_other]):
+                neg_degree, neg_pos = heapq.heappop(heap)
+                last_key = (-neg_degree, -neg_pos)
+                removed.add(-neg_pos)
+                taken_out = [-neg_pos] + taken_out
+            elif next_other < len(others):
+                last_key = others[next_other]
+                next_other = next_other + 1
+
+            for pos in taken_out:
+                for other in self.crossed_by[pos]:
+                    if other not in removed:
+                        degree[other] = degree[other] - 1
+                        if degree[other] == 0:
+                            zero_degree.append(other)
+                        else:
+                            heapq.heappush(heap, (-degree[other], -other))
+        return kept
+
+    # The lines check_intersections(self.current_lines()) would return.
+    # RETURN TYPE: lines_without_intersections LIST
+    def result(self):
+        if self.cached is None:
+            kept = self.kept
+            if self.one_way:
+                kept = dict(kept)
+                kept.update(self.solve_one_way())
+
+            def report_order(pos):
+                key = kept[pos]
+                if key is None:
+                    return (0, 0, 0, pos)
+                return (1, -key[0], -key[1], pos)
+            self.cached = [self.lines[pos] for pos in sorted(kept, key=report_order)]
+        return list(self.cached)
+
 
 # Take in the list of lines and then for each valid line, print out the line
 # number followed by a space.
@@ -214,18 +1683,149 @@ def print_result(lines_list):
     print("")
 
 
+# Switch ccw, ccw_xy and batch_ccw (and so intersect, intersect_xy,
+# check_line and every backend that uses them) to the filtered predicates.
+# Turned on by --robust. The sweep backend still picks the pairs to test
+# with float geometry (see SWEEP_TOLERANCE), so unlike the other backends
+# its answer is not guaranteed to be exact; every pair it reports is still
+# tested with intersect.
+filtered_predicates = False
+
+
+def use_filtered_predicates():
+    global filtered_predicates, ccw, ccw_xy, batch_ccw
+    if filtered_predicates:
+        return
+    filtered_predicates = True
+    ccw, ccw_xy, batch_ccw = ccw_filtered, ccw_filtered_xy, batch_ccw_filtered
+    # Keep counting the calls if instrumentation is already on.
+    if stats is not None:
+        ccw = counted(ccw, stats['counters'], 'ccw')
+        ccw_xy = counted(ccw_xy, stats['counters'], 'ccw_xy')
+
+
+# Instrumentation: counts how often the hot functions run and how long each
+# phase of the program takes, so a slow run shows where the time went. It is
+# off unless --instrument is given or the INSTRUMENT environment variable is
+# set ('1' reports to stderr, anything else is a file name for the report).
+#
+# While it is off, stats is None and nothing below costs anything except one
+# "is None" test per round and per phase. Turning it on replaces ccw,
+# intersect, ccw_xy, intersect_xy, check_line and batch_intersect with
+# counting versions; every caller looks them up by name, so all calls go
+# through the counting versions from then on. (Worker processes of the
+# 'parallel' backend keep their own counts, which are not reported.)
+stats = None
+
+
+# A function that does the same as function and adds one to counters[name]
+# (or the number of pairs a batch_intersect call compares) on every call.
+# RETURN TYPE: FUNCTION
+def counted(function, counters, name):
+    if name == 'batch_intersect':
+        def counting(rows, cols):
+            counters['batch_intersect_pairs'] += len(rows) * len(cols)
+            return function(rows, cols)
+    else:
+        def counting(*args):
+            counters[name] += 1
+            return function(*args)
+    return counting
+
+
+# Turn instrumentation on and write the report at exit.
+# report_file is None or '-' for stderr, or a file name.
+def enable_instrumentation(report_file=None):
+    global stats
+    if stats is not None:
+        return
+    stats = {'counters': defaultdict(int), 'phases': defaultdict(float)}
+    for name in ('ccw', 'intersect', 'ccw_xy', 'intersect_xy', 'check_line',
+                 'batch_intersect'):
+        globals()[name] = counted(globals()[name], stats['counters'], name)
+    atexit.register(write_instrumentation, report_file)
+
+
+# Write the counters and the phase times (in seconds) as JSON.
+def write_instrumentation(report_file=None):
+    report = json.dumps({'program': 'main.py',
+                         'counters': dict(stats['counters']),
+                         'phases': dict(stats['phases'])}, indent=2, sort_keys=True)
+    if report_file in (None, '-'):
+        print(report, file=sys.stderr)
+    else:
+        with open(report_file, 'w') as f:
+            f.write(report + '\n')
+
+
+# Time a phase of the program: "with phase('load'): ...". Adds the time to
+# stats['phases'][name] when instrumentation is on, and does nothing otherwise.
+class phase:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if stats is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if stats is not None:
+            stats['phases'][self.name] += time.perf_counter() - self.start
+
+
+if os.environ.get('INSTRUMENT'):
+    enable_instrumentation(None if os.environ['INSTRUMENT'] == '1'
+                           else os.environ['INSTRUMENT'])
+
+
 # This is the entire program. Everything is happening here. The if statement
 # makes it so the source is only ran as a standalone script.
 if __name__ == '__main__':
-    # Program will take a single file argument.
-    file_name = sys.argv[1]
+    # Program will take a single file argument, optionally followed by the
+    # intersection backend to use ('brute', 'sweep', 'numpy', 'grid' or
+    # 'parallel').
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file_name')
+    parser.add_argument('backend', nargs='?', default='brute',
+                        choices=['brute', 'sweep', 'numpy', 'grid', 'parallel'])
+    parser.add_argument('--incremental', action='store_true',
+                        help='find the intersections once and update them '
+                             'as lines are removed')
+    parser.add_argument('--columnar', action='store_true',
+                        help='keep the lines in a compact SegmentStore')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes for the parallel backend '
+                             '(default: one per CPU)')
+    parser.add_argument('--fast-load', action='store_true',
+                        help='parse the file with load_lines (implies --columnar)')
+    parser.add_argument('--robust', action='store_true',
+                        help='use the filtered ccw/intersect tests, which fall '
+                             'back to exact arithmetic on near-collinear points')
+    parser.add_argument('--instrument', nargs='?', const='-', metavar='FILE',
+                        help='count the hot calls, time each phase and write a '
+                             'JSON report at exit (to FILE, default stderr)')
+    args = parser.parse_args()
+    file_name = args.file_name
+    if args.robust:
+        use_filtered_predicates()
+    if args.instrument:
+        enable_instrumentation(args.instrument)
     
     # Get the lines from the file and store them.
-    lines_from_file = get_lines(file_name)
+    with phase('load'):
+        if args.fast_load:
+            lines_from_file = load_lines(file_name)
+        else:
+            lines_from_file = get_lines(file_name, args.columnar)
     
     # From the lines you extracted from the source code, find all the ones that
     # don't have intersections.
-    lines_without_intersections = check_intersections(lines_from_file) 
+    with phase('check_intersections'):
+        lines_without_intersections = check_intersections(
+            lines_from_file, args.backend, args.incremental, args.workers)
     
     # Print the largest set of line numbers where there exists no intersection.
-    print_result(lines_without_intersections)
\ No newline at end of file
+    with phase('print'):
+        print_result(lines_without_intersections)
\ No newline at end of file
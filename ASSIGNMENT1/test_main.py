@@ -0,0 +1,225 @@
+# Checks for the intersection engines in main.py against the brute force
+# check_line. Run with "python -m pytest" from this folder.
+import math
+import os
+import random
+import subprocess
+import sys
+
+import main
+from main import Coordinate, Line
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# Build Line objects numbered from 1 out of (x1, y1, x2, y2) tuples.
+# RETURN TYPE: lines LIST of objects
+def make_lines(segments):
+    return [Line(number, Coordinate(x1, y1), Coordinate(x2, y2))
+            for number, (x1, y1, x2, y2) in enumerate(segments, 1)]
+
+
+# Every ordered pair (i, j) for which intersect(lines[i], lines[j]) is true.
+# RETURN TYPE: arcs SET of TUPLES
+def brute_arcs(lines):
+    return {(i, j) for i, a in enumerate(lines) for j, b in enumerate(lines)
+            if a.index != b.index and main.intersect(a.x1y1, a.x2y2, b.x1y1, b.x2y2)}
+
+
+# Random segments on a 0.001 degree grid around San Francisco, with some
+# vertical and horizontal ones, so many of them share endpoints or pass
+# exactly through each other's endpoints.
+# RETURN TYPE: segments LIST of TUPLES
+def grid_segments(rnd, count):
+    def point():
+        return (round(37.7 + rnd.randint(0, 80) * 0.001, 3),
+                round(-122.5 + rnd.randint(0, 120) * 0.001, 3))
+    segments = []
+    for _ in range(count):
+        a, b = point(), point()
+        shape = rnd.random()
+        if shape < 0.1:
+            b = (a[0], b[1])
+        elif shape < 0.2:
+            b = (b[0], a[1])
+        segments.append(a + b)
+    return segments
+
+
+# Random segments with coordinates k / 7, which floats can't hold exactly.
+# RETURN TYPE: segments LIST of TUPLES
+def sevenths_segments(rnd, count):
+    return [tuple(rnd.randint(-30, 30) / 7 for _ in range(4)) for _ in range(count)]
+
+
+# Random segments along a few random lines, so many of them lie along
+# (almost) the same line far away from each other, where the float
+# intersect can still say they cross.
+# RETURN TYPE: segments LIST of TUPLES
+def collinear_segments(rnd, count):
+    directions = []
+    for _ in range(rnd.randint(1, 4)):
+        angle = rnd.uniform(-3.2, 3.2)
+        directions.append((rnd.uniform(-50, 50), rnd.uniform(-50, 50),
+                           math.cos(angle), math.sin(angle)))
+    segments = []
+    for _ in range(count):
+        x, y, dx, dy = rnd.choice(directions)
+        s, t = rnd.uniform(-100, 100), rnd.uniform(-100, 100)
+        segments.append((x + s * dx, y + s * dy, x + t * dx, y + t * dy))
+    return segments
+
+
+# Random triples of points where the third is on the line through the first
+# two, up to rounding, and far from them, so the plain float ccw often gets
+# the side wrong.
+# RETURN TYPE: triples LIST of TUPLES
+def near_collinear_triples(rnd, count):
+    triples = []
+    for _ in range(count):
+        ax, ay, bx, by = (rnd.uniform(-1, 1) for _ in range(4))
+        t = rnd.uniform(-100, 100)
+        triples.append((ax, ay, bx, by, ax + t * (bx - ax), ay + t * (by - ay)))
+    return triples
+
+
+def test_filtered_ccw_matches_exact():
+    triples = near_collinear_triples(random.Random(9), 2000)
+    exact = [main.ccw_exact_xy(*triple) for triple in triples]
+    assert [main.ccw_filtered_xy(*triple) for triple in triples] == exact
+    # The points are close enough to a line for the plain test to go wrong
+    assert [main.ccw_xy(*triple) for triple in triples] != exact
+    if main.np is not None:
+        columns = main.np.array(triples).T
+        assert main.batch_ccw_filtered(*columns).tolist() == exact
+
+
+def test_robust_backends_match_brute_force(tmp_path):
+    # main.py --robust rebinds ccw and intersect for the whole process, so
+    # run it in a child process and leave this one alone.
+    input_filename = str(tmp_path / 'input.txt')
+    with open(input_filename, 'w') as input_file:
+        for number, segment in enumerate(collinear_segments(random.Random(0), 40), 1):
+            input_file.write('%d: ([%.17f, %.17f], [%.17f, %.17f])\n' % ((number,) + segment))
+
+    def run(*arguments):
+        return subprocess.run([sys.executable, os.path.join(HERE, 'main.py'), input_filename] +
+                              list(arguments), capture_output=True, text=True,
+                              check=True).stdout
+
+    expected = run('brute', '--robust')
+    assert expected != run('brute')
+    backends = ['sweep', 'grid'] + (['numpy'] if main.np is not None else [])
+    for backend in backends:
+        assert run(backend, '--robust') == expected, backend
+    assert run('parallel', '--workers', '2', '--robust') == expected
+
+
+# (line number, x1, y1, x2, y2) of every line, for comparing loaders.
+# RETURN TYPE: rows LIST of TUPLES
+def line_rows(lines):
+    return [(int(line.index), line.x1y1.x, line.x1y1.y, line.x2y2.x, line.x2y2.y)
+            for line in lines]
+
+
+def test_fast_loaders_match_get_lines():
+    for number in range(1, 7):
+        file_name = os.path.join(HERE, 'sample_input%d.txt' % number)
+        expected = line_rows(main.get_lines(file_name))
+        assert line_rows(main.load_lines(file_name)) == expected
+        # Tiny chunks cut almost every row in half
+        for chunk_size in (1, 7):
+            batches = list(main.iter_line_batches(file_name, batch_size=3,
+                                                  chunk_size=chunk_size))
+            assert all(0 < len(batch) <= 3 for batch in batches)
+            assert [row for batch in batches for row in line_rows(batch)] == expected
+
+
+def test_sweep_line_through_shared_endpoint():
+    # The first line passes through the point where the other two end.
+    lines = make_lines([(37.739, -122.5, 37.765, -122.398),
+                        (37.739, -122.432, 37.752, -122.449),
+                        (37.752, -122.449, 37.726, -122.432)])
+    assert main.sweep_line_pairs(lines) == {(0, 1), (0, 2)}
+    assert main.sweep_line_arcs(lines) == brute_arcs(lines)
+    counts = main.sweep_line_counts(lines)
+    assert [counts[line.index] for line in lines] == [2, 1, 1]
+
+
+def test_sweep_line_arcs_match_brute_force():
+    rnd = random.Random(1)
+    for make in (grid_segments, sevenths_segments):
+        for _ in range(150):
+            lines = make_lines(make(rnd, rnd.choice([5, 25, 60])))
+            assert main.sweep_line_arcs(lines) == brute_arcs(lines)
+
+
+def test_sweep_line_counts_match_check_line():
+    rnd = random.Random(2)
+    for make in (grid_segments, sevenths_segments):
+        for _ in range(50):
+            lines = make_lines(make(rnd, 25))
+            counts = main.sweep_line_counts(lines)
+            assert [counts[line.index] for line in lines] == [
+                main.check_line(line, lines) for line in lines]
+
+
+def test_incremental_matches_check_intersections():
+    backends = ['brute', 'sweep', 'grid'] + (['numpy'] if main.np is not None else [])
+    rnd = random.Random(3)
+    for make in (sevenths_segments, grid_segments):
+        for case in range(200):
+            segments = make(rnd, rnd.choice([10, 25, 40]))
+            expected = [line.index for line in main.check_intersections(make_lines(segments))]
+            for backend in backends:
+                found = main.check_intersections(make_lines(segments), backend,
+                                                 incremental=True)
+                assert [line.index for line in found] == expected, backend
+            # Starting worker processes is slow, so only some cases for parallel
+            if case < 10:
+                for incremental in (False, True):
+                    found = main.check_intersections(make_lines(segments), 'parallel',
+                                                     incremental, workers=2)
+                    assert [line.index for line in found] == expected, 'parallel'
+
+
+def test_grid_matches_check_intersections_on_collinear_lines():
+    # Far apart, yet intersect says the second line crosses the first.
+    far = [(-30.943439022480334, -68.98128795316092, 28.38745129933062, -106.52749943637237),
+           (61.251568227011006, -127.32481223048137, 61.445283633390716, -127.44740064228571)]
+    rnd = random.Random(6)
+    for segments in [far] + [collinear_segments(rnd, 25) for _ in range(100)]:
+        lines = make_lines(segments)
+        assert set(main.grid_line_arcs(lines)) == brute_arcs(lines)
+        expected = [line.index for line in main.check_intersections(make_lines(segments))]
+        for incremental in (False, True):
+            found = main.check_intersections(make_lines(segments), 'grid',
+                                             incremental=incremental)
+            assert [line.index for line in found] == expected
+
+
+def test_segment_set_matches_check_intersections():
+    rnd = random.Random(4)
+    for make in (sevenths_segments, grid_segments, collinear_segments):
+        for _ in range(50 if make is collinear_segments else 150):
+            lines = make_lines(make(rnd, 60))
+            segment_set = main.SegmentSet(lines[:rnd.randint(0, 15)])
+            added = len(segment_set)
+            for _ in range(40):
+                if len(segment_set) and rnd.random() < 0.45:
+                    segment_set.remove(rnd.choice(segment_set.current_lines()).index)
+                elif added < len(lines):
+                    segment_set.insert(lines[added])
+                    added = added + 1
+                expected = main.check_intersections(segment_set.current_lines())
+                assert ([line.index for line in segment_set.result()] ==
+                        [line.index for line in expected])
+    # Far apart along almost the same line, see the grid test above.
+    lines = make_lines([
+        (-30.943439022480334, -68.98128795316092, 28.38745129933062, -106.52749943637237),
+        (61.251568227011006, -127.32481223048137, 61.445283633390716, -127.44740064228571)])
+    for start in (0, 1, 2):
+        segment_set = main.SegmentSet(lines[:start])
+        for line in lines[start:]:
+            segment_set.insert(line)
+        assert [line.index for line in segment_set.result()] == [2]
@@ -2,6 +2,105 @@
 # - they allow adding new values to non-initialized keys
 # - by default, values of these keys are defined as empty
 from collections import defaultdict
+# A deque pops from the front in O(1), unlike list.pop(0)
+from collections import deque
+# A small record type for everything one DFS finds
+from collections import namedtuple
+# An ordered dictionary makes a simple LRU cache
+from collections import OrderedDict
+# The set operations of a binary graph's neighbor lists
+from collections.abc import Set
+# Compact integer arrays for the CSR graph
+from array import array
+# The binary graph file: a packed header and a memory-mapped body
+import mmap
+import struct
+# Saving the reachability index next to the input file
+import os
+import pickle
+# Optional compressed output files
+import gzip
+# The command line pipeline: input globs, and a pool of worker processes
+import argparse
+import concurrent.futures
+import glob
+# Instrumentation: a JSON report at exit, phase timers
+import atexit
+import json
+import sys
+import time
+# Settling vertices closest first after an edge is removed
+import heapq
+# A process pool over a graph kept in shared memory
+import multiprocessing
+import weakref
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+# NumPy is only needed for bfs_numpy; everything else works without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Instrumentation, off unless the INSTRUMENT environment variable is set
+# ('1' writes the report to stderr, anything else is a file name for it).
+# While it is off, stats is None and the searches pay one "is None" test
+# per call (or per level); the counts are worked out after the fact where
+# possible, e.g. a BFS dequeues every vertex it reaches exactly once.
+stats = None
+
+
+def enable_instrumentation(report_file=None):
+    """Start counting and timing, and write the report at exit.
+
+    report_file is None or '-' for stderr, or a file name.
+    """
+    global stats
+    if stats is None:
+        stats = {'counters': defaultdict(int), 'phases': defaultdict(float)}
+        atexit.register(write_instrumentation, report_file)
+
+
+def write_instrumentation(report_file=None):
+    """Write the counters and the phase times (in seconds) as JSON."""
+    report = json.dumps({'program': 'graphs.py',
+                         'counters': dict(stats['counters']),
+                         'phases': dict(stats['phases'])}, indent=2, sort_keys=True)
+    if report_file in (None, '-'):
+        print(report, file=sys.stderr)
+    else:
+        with open(report_file, 'w') as output_file:
+            output_file.write(report + '\n')
+
+
+def count(name, amount=1):
+    """Add to a counter; callers check that stats is not None first."""
+    stats['counters'][name] += amount
+
+
+class phase:
+    """'with phase(name):' adds the time the block takes to that phase."""
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if stats is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if stats is not None:
+            stats['phases'][self.name] += time.perf_counter() - self.start
+
+
+if os.environ.get('INSTRUMENT'):
+    enable_instrumentation(None if os.environ['INSTRUMENT'] == '1'
+                           else os.environ['INSTRUMENT'])
+
 
 def read_graph(filename):
     """Read the graph from the input file.
@@ -28,31 +127,440 @@ def read_graph(filename):
     # Review all nodes: 
     # if the node doesn't have an incoming connection,
     # then initialize it as an empty set
-    for i in range(1, len(graph.keys()) + 1):
-        if i not in set(graph.keys()):
+    # (take the set of keys once, not on every pass through the loop)
+    nodes = set(graph.keys())
+    for i in range(1, len(nodes) + 1):
+        if i not in nodes:
             graph[i] = set()
 
     # Return as a normal dictionary
     return dict(graph)
 
 
+class CSRGraph:
+    """A directed graph in compressed sparse row (CSR) form.
+
+    - offsets: offsets[v] .. offsets[v + 1] is where v's edges are
+    - neighbors: the targets of all edges, grouped by source vertex
+    Both are array('i'), so each edge costs 4 bytes instead of a set entry.
+
+    It also behaves like the dictionary of sets from read_graph: graph[v]
+    gives the set of v's neighbors, and keys() gives the same vertices in
+    the same order, so bfs, bfs_paths and the DFS functions accept it as is.
+    Code that wants speed can read the neighbors of v straight from the
+    arrays with neighbors_of(v).
+    """
+
+    def __init__(self, offsets, neighbors, nodes, is_node=None):
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.ordered = None
+        # The vertices that read_graph would have made keys, in its order
+        self.nodes = nodes
+        # is_node[v] is 1 for those vertices (built here unless given)
+        if is_node is None:
+            is_node = bytearray(len(offsets) - 1)
+            for v in nodes:
+                is_node[v] = 1
+        self.is_node = is_node
+
+    @property
+    def num_vertices(self):
+        """Vertex ids run from 0 to num_vertices - 1 in the arrays."""
+        return len(self.offsets) - 1
+
+    def neighbors_of(self, v):
+        """The targets of v's edges as a slice of the neighbors array."""
+        return self.neighbors[self.offsets[v]:self.offsets[v + 1]]
+
+    def degree(self, v):
+        return self.offsets[v + 1] - self.offsets[v]
+
+    def set_ordered(self):
+        """Offsets and neighbors arrays with every vertex's edges in the order
+        graph[v] iterates them (repeated edges dropped).
+
+        Searches that follow these arrays pick the same parents as the ones
+        that loop over graph[v]. Built once, on first use.
+        """
+        if self.ordered is None:
+            offsets = array('i', [0])
+            neighbors = array('i')
+            for v in range(self.num_vertices):
+                neighbors.extend(set(self.neighbors_of(v)))
+                offsets.append(len(neighbors))
+            self.ordered = (offsets, neighbors)
+        return self.ordered
+
+    # The dictionary-of-sets view
+    def __getitem__(self, v):
+        if v not in self:
+            raise KeyError(v)
+        return set(self.neighbors_of(v))
+
+    def __contains__(self, v):
+        return isinstance(v, int) and 0 <= v < len(self.is_node) and self.is_node[v] == 1
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def keys(self):
+        return self.nodes
+
+    def items(self):
+        for v in self.nodes:
+            yield v, self[v]
+
+
+def read_graph_csr(filename):
+    """Read the same edge list format as read_graph into a CSRGraph.
+
+    The whole file is split into numbers in one go, and the edges are then
+    grouped by source with a counting sort (two passes, no per-vertex sets).
+    Each vertex keeps its edges in file order, which is also the order
+    read_graph added them to its sets, so graph[v] iterates the same way.
+    """
+    with open(filename, 'rb') as input_data:
+        numbers = array('i', map(int, input_data.read().split()))
+    sources, targets = numbers[0::2], numbers[1::2]
+
+    num_vertices = max(max(numbers, default=0), len(set(sources))) + 1
+
+    # Count the edges of every source, then turn counts into offsets
+    offsets = array('i', bytes(4 * (num_vertices + 1)))
+    for a in sources:
+        offsets[a + 1] += 1
+    for v in range(num_vertices):
+        offsets[v + 1] += offsets[v]
+
+    # Drop every edge into the next free slot of its source
+    neighbors = array('i', bytes(4 * len(targets)))
+    fill = array('i', offsets)
+    for a, b in zip(sources, targets):
+        neighbors[fill[a]] = b
+        fill[a] += 1
+
+    # Same vertices, in the same order, as the keys read_graph returns:
+    # sources in order of first appearance, then the missing 1..n
+    seen = bytearray(num_vertices)
+    nodes = array('i')
+    for a in sources:
+        if not seen[a]:
+            seen[a] = 1
+            nodes.append(a)
+    for i in range(1, len(nodes) + 1):
+        if not seen[i]:
+            nodes.append(i)
+
+    return CSRGraph(offsets, neighbors, nodes)
+
+
+class OrderedNeighbors(Set):
+    """A read-only set of neighbors that iterates in a fixed order.
+
+    It has the set operations of a set (graph[node] - set(path) and the
+    like), and their results keep this order too.
+    """
+
+    __slots__ = ('order', 'members')
+
+    def __init__(self, neighbors=()):
+        self.order = tuple(neighbors)
+        # Built on the first membership test; most callers only iterate
+        self.members = None
+
+    def __contains__(self, v):
+        if self.members is None:
+            self.members = frozenset(self.order)
+        return v in self.members
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __repr__(self):
+        return 'OrderedNeighbors(%r)' % (list(self.order),)
+
+
+class OrderedCSRGraph(CSRGraph):
+    """A CSRGraph whose arrays already hold every vertex's edges in set order.
+
+    graph[v] returns them as an OrderedNeighbors, in that order, instead of
+    building a set (a set built from a set's own order may iterate
+    differently). So bfs_tree and the DFS functions give the same results
+    as on read_graph's dictionary. bfs_paths takes graph[node] - set(path),
+    which on real sets can come out in yet another order, so on ties it
+    may pick another of the shortest paths.
+    """
+
+    def __getitem__(self, v):
+        if v not in self:
+            raise KeyError(v)
+        return OrderedNeighbors(self.neighbors_of(v))
+
+    def set_ordered(self):
+        return self.offsets, self.neighbors
+
+
+# Binary graph files: a header, then the arrays of an OrderedCSRGraph
+# - magic (8 bytes), version, byte order mark (4 bytes each)
+# - num_vertices, num_edges, num_nodes (8 bytes each)
+# - offsets, neighbors, nodes (32-bit ints), is_node (1 byte per vertex)
+GRAPH_MAGIC = b'CSRGRAPH'
+GRAPH_HEADER = struct.Struct('=8sIIQQQ')
+GRAPH_BYTE_ORDER = 0x01020304
+
+
+def write_graph_binary(input_filename, output_filename=None):
+    """Convert a text edge list into a binary graph file (default '<input>.csr').
+
+    Every vertex's edges are stored in the order read_graph's sets iterate
+    them, so searches on the loaded graph give the same results.
+    """
+    if output_filename is None:
+        output_filename = input_filename + '.csr'
+    graph = read_graph_csr(input_filename)
+    offsets, neighbors = graph.set_ordered()
+    with open(output_filename, 'wb') as output_file:
+        output_file.write(GRAPH_HEADER.pack(GRAPH_MAGIC, 1, GRAPH_BYTE_ORDER,
+                                            graph.num_vertices, len(neighbors), len(graph.nodes)))
+        for part in (offsets, neighbors, graph.nodes, graph.is_node):
+            output_file.write(part)
+    return output_filename
+
+
+def read_graph_binary(filename):
+    """Open a binary graph file as an OrderedCSRGraph without reading it.
+
+    The file is memory-mapped and the graph's arrays are views into the
+    mapping, so opening takes the same time for any size; pages are read
+    from disk only when a search touches them.
+    """
+    with open(filename, 'rb') as input_file:
+        data = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, byte_order, num_vertices, num_edges, num_nodes = \
+        GRAPH_HEADER.unpack_from(data)
+    if magic != GRAPH_MAGIC or version != 1:
+        raise ValueError(filename + ' is not a binary graph file')
+    if byte_order != GRAPH_BYTE_ORDER:
+        raise ValueError(filename + ' was written on a machine with another byte order')
+
+    view = memoryview(data)
+    start = GRAPH_HEADER.size
+    parts = []
+    for count, size, code in ((num_vertices + 1, 4, 'i'), (num_edges, 4, 'i'),
+                              (num_nodes, 4, 'i'), (num_vertices, 1, 'B')):
+        parts.append(view[start:start + count * size].cast(code))
+        start += count * size
+    graph = OrderedCSRGraph(*parts)
+    # Keep the mapping open as long as the graph is used
+    graph.mapping = data
+    return graph
+
+
 def bfs(graph, start):
     """Breadth-first search in a graph starting from the node 'start'.
+
+    Returns the set of nodes reachable from 'start'. See bfs_levels for the
+    distances and parents as well.
     """
-    # Initialize the set of visited nodes + queue of the nodes to visit
-    visited, queue = set(), [start]
-    # While queue is not empty = we still have nodes to visit:
-    while queue:
-        # Return and remove the first element of the queue
-        node = queue.pop(0)
-        # If node was not visited yet
-        if node not in visited:
-            # Mark it as visited
-            visited.add(node)
-            # Add outgoing connections from this node to the queue (except visited)
-            queue.extend(graph[node] - visited)
-    # Return the list of visited nodes in the right order
-    return visited
+    distances, parents = bfs_levels(graph, start)
+    return set(distances)
+
+
+def out_neighbors(graph):
+    """Return a function giving the outgoing neighbors of a vertex.
+
+    For a CSRGraph this reads the neighbors array directly instead of
+    building a set for every vertex.
+    """
+    if isinstance(graph, CSRGraph):
+        return graph.neighbors_of
+    return graph.__getitem__
+
+
+def reverse_graph(graph):
+    """Incoming edges of every node: node -> list of nodes with an edge into it."""
+    neighbors = out_neighbors(graph)
+    predecessors = defaultdict(list)
+    for node in graph.keys():
+        for next in neighbors(node):
+            predecessors[next].append(node)
+    return predecessors
+
+
+def bfs_levels(graph, start, alpha=14, beta=24, predecessors=None):
+    """Level-synchronous BFS from 'start' that picks a direction per level.
+
+    Returns two dictionaries for the reachable nodes:
+    - distances: number of edges on a shortest path from 'start'
+    - parents: the node each one was reached from ('start' maps to None)
+
+    Every node is marked when it is first discovered, so nothing is queued
+    twice. Each level is expanded as a whole, in one of two ways:
+    - top-down: look at the edges out of every node in the frontier
+    - bottom-up: for every node not reached yet, look for an edge into it
+      from the frontier, and stop at the first one found
+    Bottom-up is much cheaper once the frontier covers a big part of the
+    graph (the middle levels of a large low-diameter graph). Like Beamer's
+    direction-optimizing BFS, we switch to bottom-up when the frontier has
+    more than 1/alpha of the unexplored edges, and back to top-down when it
+    has fewer than 1/beta of the nodes.
+
+    Going bottom-up needs the incoming edges of every node. Building them
+    (reverse_graph) costs about as much as one whole search, so bottom-up
+    steps are only taken when 'predecessors' is passed in; build it once
+    and reuse it for every search on the same graph.
+    """
+    neighbors = out_neighbors(graph)
+    if isinstance(graph, CSRGraph):
+        degree = graph.degree
+    else:
+        degree = lambda node: len(graph[node])
+    distances = {start: 0}
+    parents = {start: None}
+
+    # Numbers for the direction heuristic
+    total_nodes = len(graph)
+    unexplored_edges = sum(map(degree, graph.keys())) - degree(start)
+
+    # Nodes not reached yet, only needed once we go bottom-up
+    unvisited = None
+
+    frontier = [start]
+    top_down = True
+    while frontier:
+        frontier_edges = sum(map(degree, frontier))
+        if top_down and predecessors is not None and frontier_edges > unexplored_edges / alpha:
+            top_down = False
+        elif not top_down and len(frontier) < total_nodes / beta:
+            top_down = True
+        if stats is not None and top_down:
+            count('vertices_dequeued', len(frontier))
+            count('edges_scanned', frontier_edges)
+
+        next_frontier = []
+        if top_down:
+            for node in frontier:
+                for next in neighbors(node):
+                    if next not in distances:
+                        distances[next] = distances[node] + 1
+                        parents[next] = node
+                        next_frontier.append(next)
+        else:
+            if unvisited is None:
+                unvisited = [node for node in predecessors if node not in distances]
+            if stats is not None:
+                count('bottom_up_checks', len(unvisited))
+            in_frontier = set(frontier)
+            still_unvisited = []
+            for node in unvisited:
+                if node in distances:
+                    continue
+                for previous in predecessors[node]:
+                    if previous in in_frontier:
+                        distances[node] = distances[previous] + 1
+                        parents[node] = previous
+                        next_frontier.append(node)
+                        break
+                else:
+                    still_unvisited.append(node)
+            unvisited = still_unvisited
+
+        unexplored_edges -= sum(map(degree, next_frontier))
+        frontier = next_frontier
+
+    return distances, parents
+
+def bfs_numpy(graph, start, set_order=False):
+    """BFS over the arrays of a CSRGraph with NumPy, one level at a time.
+
+    The frontier is an array of vertex ids. Each level gathers the CSR
+    neighbor slices of the whole frontier at once, masks out the vertices
+    that were already reached, and scatters the distances and parents of the
+    new ones, so there is no Python work per vertex.
+
+    Returns two arrays indexed by vertex id:
+    - distances: edges on a shortest path from 'start' (-1 if unreachable)
+    - parents: the vertex each one was reached from (-1 for 'start' and
+      unreachable vertices)
+
+    A vertex reached from several frontier vertices takes the first one in
+    frontier order, and new vertices keep the order they were first seen
+    in, exactly like a queue-based BFS that follows each vertex's edges in
+    file order. With set_order=True the edges are followed in the order
+    graph[v] iterates them instead (see CSRGraph.set_ordered), which gives
+    the same paths as bfs_tree. The distances always match bfs_paths, but
+    when several shortest paths tie, bfs_paths may pick another one (the
+    reports of the sample inputs come out the same). Use bfs_path_array to
+    rebuild a path.
+    """
+    if np is None:
+        raise ImportError('bfs_numpy needs NumPy installed')
+    if set_order:
+        offsets, neighbors = graph.set_ordered()
+    else:
+        offsets, neighbors = graph.offsets, graph.neighbors
+    offsets = np.frombuffer(offsets, dtype=np.intc).astype(np.int64)
+    neighbors = np.frombuffer(neighbors, dtype=np.intc)
+    num_vertices = graph.num_vertices
+
+    distances = np.full(num_vertices, -1, dtype=np.int64)
+    parents = np.full(num_vertices, -1, dtype=np.int64)
+    distances[start] = 0
+
+    frontier = np.array([start], dtype=np.int64)
+    level = 0
+    while frontier.size:
+        level += 1
+        # Where each frontier vertex's neighbors start, and how many it has
+        starts = offsets[frontier]
+        counts = offsets[frontier + 1] - starts
+        total = int(counts.sum())
+        if stats is not None:
+            count('vertices_dequeued', frontier.size)
+            count('edges_scanned', total)
+        if total == 0:
+            break
+
+        # Positions of all the frontier's neighbors in the neighbors array,
+        # and which frontier vertex each one came from
+        ends = np.cumsum(counts)
+        positions = np.arange(total) + np.repeat(starts - (ends - counts), counts)
+        found = neighbors[positions]
+        owners = np.repeat(frontier, counts)
+
+        # Keep only vertices not reached yet, first appearance of each
+        new = distances[found] < 0
+        found, owners = found[new], owners[new]
+        unique, first = np.unique(found, return_index=True)
+        first.sort()
+
+        frontier = found[first].astype(np.int64)
+        distances[frontier] = level
+        parents[frontier] = owners[first]
+
+    return distances, parents
+
+
+def bfs_path_array(parents, start, end):
+    """Rebuild the shortest path from 'start' to 'end' out of bfs_numpy parents.
+
+    Like bfs_paths, returns [start] if 'end' can't be reached (or is 'start').
+    """
+    if end == start or parents[end] < 0:
+        return [start]
+    path = [end]
+    while path[-1] != start:
+        path.append(int(parents[path[-1]]))
+    path.reverse()
+    return path
+
 
 def bfs_paths(graph, start, end):
     """Find shortest paths in the graph from node 'start' to node 'finish'.
@@ -63,8 +571,13 @@ def bfs_paths(graph, start, end):
     while queue:
         # Return and remove the first element of the queue
         (node, path) = queue.pop(0)
+        if stats is not None:
+            count('vertices_dequeued')
+            count('edges_scanned', len(graph[node]))
         # For each outgoing connection which wasn't visited yet
         for next in graph[node] - set(path):
+            if stats is not None:
+                count('path_copies')
             # If we reached our destination node
             if next == end:
                 # Return the resulting path
@@ -76,151 +589,1195 @@ def bfs_paths(graph, start, end):
     return [start]
 
 
-def dfs_times(graph, starting_vertex):
-    visited = set()
-    counter = [0]
-    traversal_times = defaultdict(dict)
+def bfs_tree(graph, start):
+    """Single-source BFS from node 'start' to every node at once.
 
-    def traverse(vertex):
-        visited.add(vertex)
-        counter[0] += 1
-        traversal_times[vertex]['discovery'] = counter[0]
+    Returns two dictionaries for the reachable nodes:
+    - distances: number of edges on a shortest path from 'start'
+    - parents: the node each one was discovered from ('start' maps to None)
 
-        for next_vertex in graph[vertex]:
-            if next_vertex not in visited:
-                traverse(next_vertex)
+    This is one O(V+E) pass; use bfs_path to rebuild any single path.
+    The paths have the same length as the ones from bfs_paths (when several
+    paths are equally short, the one picked can depend on set ordering).
+    """
+    distances = {start: 0}
+    parents = {start: None}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        # The first time we see a node is along a shortest path
+        for next in graph[node]:
+            if next not in distances:
+                distances[next] = distances[node] + 1
+                parents[next] = node
+                queue.append(next)
+    if stats is not None:
+        count('vertices_dequeued', len(distances))
+        count('edges_scanned', sum(len(graph[node]) for node in distances))
+    return distances, parents
 
-        counter[0] += 1
-        traversal_times[vertex]['finish'] = counter[0]
 
-    # in this case start with just one vertex, but we could equally
-    # dfs from all_vertices to product a dfs forest
-    traverse(starting_vertex)
-    return traversal_times
+def bfs_path(parents, start, end):
+    """Rebuild the shortest path from 'start' to 'end' out of bfs_tree parents.
 
-def dfs_tree(graph, starting_vertex):
-    visited = set()
-    tree = []
+    Like bfs_paths, returns [start] if 'end' can't be reached (or is 'start').
+    """
+    if end == start or end not in parents:
+        return [start]
+    # Walk the parent pointers back to the start, then reverse
+    path = [end]
+    while parents[path[-1]] is not None:
+        path.append(parents[path[-1]])
+    path.reverse()
+    return path
 
-    def compute_tree(vertex):
-        visited.add(vertex)
-        for next_vertex in graph[vertex]:
-            if next_vertex not in visited:
-                tree.append((vertex, next_vertex))
-                compute_tree(next_vertex)
 
-    # in this case start with just one vertex, but we could equally
-    # dfs from all_vertices to product a dfs forest
-    compute_tree(starting_vertex)
-    return tree
+def multi_source_bfs(graph, sources):
+    """BFS from many sources at the same time (MS-BFS).
+
+    Every source gets one bit, and every vertex keeps two bit masks:
+    - seen: the sources that have already reached it
+    - visit: the sources whose frontier it is on at this level
+    One pass over a vertex's edges then moves all of its sources forward
+    together: a neighbor gets the bits of 'visit' that it hasn't seen yet.
+    With 64 sources the masks fit in a machine word, and the edges are
+    walked once per level for all of them instead of once per source. Each
+    source still gets its own distance for every vertex it reaches, so the
+    work does grow with the number of sources: 64 of them took about a
+    quarter of the time of 64 separate bfs_tree calls, or about 16 times
+    as long as one.
+
+    Returns one dictionary per source (in the same order), mapping every
+    vertex that source can reach to its number of hops.
+    """
+    neighbors = out_neighbors(graph)
+    distances = [{} for source in sources]
+    seen = defaultdict(int)
+    visit = defaultdict(int)
+    for i, source in enumerate(sources):
+        seen[source] |= 1 << i
+        visit[source] |= 1 << i
+        distances[i][source] = 0
+
+    level = 0
+    while visit:
+        level += 1
+        if stats is not None:
+            count('vertices_dequeued', len(visit))
+            count('edges_scanned', sum(len(neighbors(node)) for node in visit))
+        visit_next = defaultdict(int)
+        for node, bits in visit.items():
+            for next in neighbors(node):
+                new = bits & ~seen[next]
+                if new:
+                    visit_next[next] |= new
+                    seen[next] |= new
+                    # Record the distance for each source that just arrived
+                    while new:
+                        low = new & -new
+                        distances[low.bit_length() - 1][next] = level
+                        new ^= low
+        visit = visit_next
+    return distances
+
+
+def hop_distances(graph, sources=None, batch=64):
+    """Yield (source, distances) for every source, in order.
+
+    The sources (all vertices by default) are searched 'batch' at a time
+    with multi_source_bfs, so an all-pairs table takes V/64 multi-source
+    searches instead of V single-source ones. That is a few times faster,
+    not 64 times (see multi_source_bfs). Rows are handed out as soon as
+    their batch is done, so the whole table never has to be in memory at
+    once.
+    """
+    if sources is None:
+        sources = list(graph.keys())
+    for start in range(0, len(sources), batch):
+        chunk = sources[start:start + batch]
+        for source, distances in zip(chunk, multi_source_bfs(graph, chunk)):
+            yield source, distances
+
+
+def write_hops_output(input_filename, output_filename, compress=None):
+    """Create an output file with the hop distance between every pair of vertices."""
+    # Read the graph
+    with phase('read_graph'):
+        graph = read_graph(input_filename)
+    write_hops_report(graph, output_filename, compress)
+
+
+def write_hops_report(graph, output_filename, compress=None):
+    """Write the hop distance report of an already loaded graph."""
+    nodes = range(1, len(graph.keys()) + 1)
+    # Write the output file
+    with phase('hops'), ReportWriter(output_filename, compress) as output_file:
+        # Write the header: one column per target vertex, '-' if it can't be reached
+        output_file.write('Source: Hops to ' + ' '.join(map(str, nodes)) + '\n')
+        for source, distances in hop_distances(graph, list(nodes)):
+            row = [str(distances[node]) if node in distances else '-' for node in nodes]
+            output_file.write(str(source) + ' : ' + ' '.join(row) + '\n')
+
+
+# Everything one depth-first search finds:
+# - times: vertex -> {'discovery': ..., 'finish': ...}
+# - tree: tree edges, in the order they were followed
+# - order: vertices in the order they were discovered (preorder)
+# - back, forward, cross: the other edges, classified during the same walk
+DFSResult = namedtuple('DFSResult', 'times tree order back forward cross')
+
+
+def dfs(graph, starting_vertex, forest=False):
+    """Depth-first search that records everything in a single O(V+E) walk.
+
+    Uses an explicit stack instead of recursion, so deep graphs don't hit
+    Python's recursion limit. Neighbors are visited in the same order as the
+    recursive traversals, so the times, tree and order are the same.
+
+    With forest=True, once 'starting_vertex' is done the search restarts
+    from every vertex that hasn't been reached yet (in increasing order),
+    producing a DFS forest that covers all vertices.
+    """
+    times = defaultdict(dict)
+    tree, order = [], []
+    back, forward, cross = [], [], []
+    counter = 0
+
+    roots = [starting_vertex]
+    if forest:
+        roots.extend(sorted(graph.keys()))
+
+    for root in roots:
+        # Skip roots that an earlier search already reached
+        if root in times:
+            continue
+        counter += 1
+        times[root]['discovery'] = counter
+        order.append(root)
+        # Each stack entry is a vertex and an iterator over its neighbors,
+        # so we can pick up where we left off when we come back to it
+        stack = [(root, iter(graph[root]))]
+
+        while stack:
+            vertex, neighbors = stack[-1]
+            for next_vertex in neighbors:
+                if next_vertex not in times:
+                    # Not seen yet: follow the edge, like the recursive call
+                    tree.append((vertex, next_vertex))
+                    counter += 1
+                    times[next_vertex]['discovery'] = counter
+                    order.append(next_vertex)
+                    stack.append((next_vertex, iter(graph[next_vertex])))
+                    break
+                elif 'finish' not in times[next_vertex]:
+                    # Still on the stack: an ancestor (or the vertex itself)
+                    back.append((vertex, next_vertex))
+                elif times[vertex]['discovery'] < times[next_vertex]['discovery']:
+                    # Finished and discovered after us: a descendant
+                    forward.append((vertex, next_vertex))
+                else:
+                    # Finished and discovered before us: another branch
+                    cross.append((vertex, next_vertex))
+            else:
+                # All neighbors done: the vertex is finished
+                stack.pop()
+                counter += 1
+                times[vertex]['finish'] = counter
+
+    if stats is not None:
+        count('vertices_dequeued', len(order))
+        count('edges_scanned', len(tree) + len(back) + len(forward) + len(cross))
+    return DFSResult(times, tree, order, back, forward, cross)
+
+
+def dfs_times(graph, starting_vertex):
+    # in this case start with just one vertex, but dfs(..., forest=True)
+    # produces a dfs forest from all vertices
+    return dfs(graph, starting_vertex).times
+
+def dfs_tree(graph, starting_vertex):
+    return dfs(graph, starting_vertex).tree
 
 def dfs_edges(tree, graph, order):
-    tree_graph = defaultdict(set)
+    """Classify the non-tree edges of the graph as back, forward or cross.
+
+    v is a descendant of u exactly when v's discovery/finish interval in the
+    DFS tree sits inside u's, so every ancestor check is two comparisons and
+    no descendant sets are built. The intervals are numbered from 'tree'
+    itself, starting at the vertices in 'order'.
+
+    - back: (v, u) where v is a descendant of u
+    - forward: (u, v) where v is a descendant of u, but not a tree edge
+    - cross: every edge where neither end is a descendant of the other
+    Within each u, back and forward edges are listed by increasing v.
+    """
+    # Children of every vertex in the tree
+    children = defaultdict(list)
     for (u, v) in tree:
-        tree_graph[u].add(v)
+        children[u].append(v)
+    tree_edges = set(tree)
+
+    # Give every tree vertex a discovery/finish interval (no recursion)
+    discovery, finish = {}, {}
+    counter = 0
+    for root in list(order) + [u for (u, v) in tree]:
+        if root in discovery:
+            continue
+        counter += 1
+        discovery[root] = counter
+        stack = [(root, iter(children[root]))]
+        while stack:
+            vertex, below = stack[-1]
+            for child in below:
+                if child not in discovery:
+                    counter += 1
+                    discovery[child] = counter
+                    stack.append((child, iter(children[child])))
+                    break
+            else:
+                stack.pop()
+                counter += 1
+                finish[vertex] = counter
+
+    def is_descendant(v, u):
+        # v's interval strictly inside u's
+        return (u in discovery and v in discovery and
+                discovery[u] < discovery[v] and finish[v] < finish[u])
 
-    def get_children(node):
-        for child in tree_graph[node]:
-            yield child
-            for grandchild in get_children(child):
-                yield grandchild
+    # Incoming edges of every vertex, for finding back edges into u
+    predecessors = defaultdict(list)
+    for u in graph.keys():
+        for v in graph[u]:
+            predecessors[v].append(u)
 
     back = []
     forward = []
     cross = []
 
-    descents_ok = defaultdict(set)
     for u in graph.keys():
-        descents = get_children(u)
-        for i in descents:
-            descents_ok[u].add(i)
-        for v in descents_ok[u]:
-            if u in graph[v]:
+        for v in sorted(predecessors[u]):
+            if is_descendant(v, u):
                 back.append((v, u))
-            if v in graph[u] and (u, v) not in tree:
+        for v in sorted(graph[u]):
+            if is_descendant(v, u) and (u, v) not in tree_edges:
                 forward.append((u, v))
-                        
 
     for u in graph.keys():
         for v in graph[u]:
-            if u not in descents_ok[v] and v not in descents_ok[u]:
-                cross.append((u, v))                
-        
+            if not is_descendant(u, v) and not is_descendant(v, u):
+                cross.append((u, v))
+
     return back, forward, cross
 
 def dfs_order(graph, starting_vertex):
-    visited = set()
-    order = [starting_vertex]
+    return dfs(graph, starting_vertex).order
 
-    def compute_order(vertex):
-        visited.add(vertex)
-        for next_vertex in graph[vertex]:
-            if next_vertex not in visited:
-                order.append(next_vertex)
-                compute_order(next_vertex)
 
-    # in this case start with just one vertex, but we could equally
-    # dfs from all_vertices to product a dfs forest
-    compute_order(starting_vertex)
-    return order
+def strongly_connected_components(graph):
+    """Tarjan's strongly connected components, without recursion.
 
+    Every vertex gets an index (when it's discovered) and a lowlink (the
+    smallest index it can get back to). A vertex whose lowlink is its own
+    index is the root of a component: everything above it on the stack.
+    The DFS keeps an explicit stack of (vertex, neighbor iterator), so it
+    runs in O(V+E) on million-vertex graphs without hitting the recursion
+    limit.
 
-def write_bfs_output(input_filename, output_filename):
-    """Create an output file with BFS data for the given input file."""
-    # Read the graph
+    Returns the components as lists of vertices, in reverse topological
+    order (a component comes before every component that can reach it).
+    """
+    neighbors = out_neighbors(graph)
+
+    def edges_of(vertex):
+        # Vertices that only appear as targets have no outgoing edges
+        return iter(neighbors(vertex)) if vertex in graph else iter(())
+
+    index, lowlink = {}, {}
+    stack, on_stack = [], set()
+    components = []
+    counter = 0
+
+    for root in graph.keys():
+        if root in index:
+            continue
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, edges_of(root))]
+
+        while work:
+            vertex, edges = work[-1]
+            for next_vertex in edges:
+                if next_vertex not in index:
+                    # Go deeper, like the recursive call
+                    index[next_vertex] = lowlink[next_vertex] = counter
+                    counter += 1
+                    stack.append(next_vertex)
+                    on_stack.add(next_vertex)
+                    work.append((next_vertex, edges_of(next_vertex)))
+                    break
+                elif next_vertex in on_stack:
+                    lowlink[vertex] = min(lowlink[vertex], index[next_vertex])
+            else:
+                # Done with this vertex: pass its lowlink up to its parent
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[vertex])
+                # A root pops its whole component off the stack
+                if lowlink[vertex] == index[vertex]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == vertex:
+                            break
+                    components.append(component)
+
+    return components
+
+
+def condensation(graph):
+    """Shrink every strongly connected component to a single vertex.
+
+    Returns three things:
+    - components: lists of vertices, numbered in topological order
+    - component_of: vertex -> number of its component
+    - dag: component number -> set of component numbers it has edges to
+    Every edge of the DAG goes from a lower number to a higher one, so
+    range(len(components)) is a topological order of it.
+    """
+    components = strongly_connected_components(graph)
+    components.reverse()
+    component_of = {}
+    for number, component in enumerate(components):
+        for vertex in component:
+            component_of[vertex] = number
+
+    neighbors = out_neighbors(graph)
+    dag = {number: set() for number in range(len(components))}
+    for vertex in graph.keys():
+        for next_vertex in neighbors(vertex):
+            if component_of[vertex] != component_of[next_vertex]:
+                dag[component_of[vertex]].add(component_of[next_vertex])
+    return components, component_of, dag
+
+
+def topological_order(graph):
+    """A real topological order of the graph's condensation DAG.
+
+    Returns the strongly connected components (each a sorted list of
+    vertices) so that every edge between two components goes from an
+    earlier one to a later one. If the graph has no cycles every component
+    is a single vertex, and this is a topological order of the vertices.
+    """
+    components, component_of, dag = condensation(graph)
+    return [sorted(component) for component in components]
+
+
+class ReachabilityIndex:
+    """Answer "can u reach v?" and "how far?" many times on one graph.
+
+    Built once per graph:
+    - the condensation (strongly connected components, numbered in
+      topological order), so cycles are never walked again
+    - interval labels on the condensation DAG (GRAIL): every component c
+      gets post[c], its DFS finish rank, and low[c], the smallest rank it
+      can reach. If u reaches v then v's interval [low, post] is inside
+      u's, so most "no" answers take two comparisons. If v is inside u's
+      DFS subtree the answer is "yes" right away. Only what is left needs
+      a (heavily pruned) search of the DAG.
+    - BFS distances to and from a few landmark vertices, which bound the
+      hop distance between any two vertices without a search
+
+    Exact shortest paths are found with a BFS that skips vertices that
+    can't lead to the target, and kept in an LRU cache.
+    """
+
+    version = 1
+
+    def __init__(self, graph, landmarks=8, cache_size=1024):
+        self.graph = graph
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+        components, self.component_of, dag = condensation(graph)
+        count = len(components)
+
+        # Post-order ranks and DFS-subtree intervals of the DAG
+        self.post = [0] * count
+        self.tree_low = [0] * count
+        visited = [False] * count
+        rank = 0
+        for root in range(count):
+            if visited[root]:
+                continue
+            visited[root] = True
+            self.tree_low[root] = rank
+            work = [(root, iter(dag[root]))]
+            while work:
+                c, children = work[-1]
+                for child in children:
+                    if not visited[child]:
+                        visited[child] = True
+                        self.tree_low[child] = rank
+                        work.append((child, iter(dag[child])))
+                        break
+                else:
+                    work.pop()
+                    self.post[c] = rank
+                    rank += 1
+
+        # low[c]: smallest rank reachable from c. Every DAG edge goes to a
+        # higher component number, so go from the last component back.
+        self.low = list(self.post)
+        for c in range(count - 1, -1, -1):
+            for child in dag[c]:
+                if self.low[child] < self.low[c]:
+                    self.low[c] = self.low[child]
+        self.dag = {c: sorted(dag[c]) for c in dag}
+
+        # Landmarks: the vertices with the most outgoing edges
+        neighbors = out_neighbors(graph)
+        chosen = sorted(graph.keys(), key=lambda v: -len(neighbors(v)))[:landmarks]
+        predecessors = reverse_graph(graph)
+        forward = graph
+        if not isinstance(graph, CSRGraph):
+            # Vertices that only appear as targets have no outgoing edges
+            forward = defaultdict(tuple, graph)
+        self.landmarks = chosen
+        self.from_landmark = [bfs_levels(forward, l, predecessors=predecessors)[0]
+                              for l in chosen]
+        self.to_landmark = [bfs_tree(predecessors, l)[0] for l in chosen]
+
+    def can_reach(self, u, v):
+        """True if there is a path from u to v."""
+        if u not in self.component_of or v not in self.component_of:
+            return False
+        cu, cv = self.component_of[u], self.component_of[v]
+        return self.component_reaches(cu, cv)
+
+    def component_reaches(self, cu, cv):
+        if cu == cv:
+            return True
+        # Edges only go to higher numbers; then the interval test
+        if cu > cv or not self.contains(cu, cv):
+            return False
+        if self.tree_low[cu] <= self.post[cv] <= self.post[cu]:
+            return True
+        # Search the DAG, only through components that still might reach cv
+        stack, seen = [cu], {cu}
+        while stack:
+            c = stack.pop()
+            for child in self.dag[c]:
+                if child == cv:
+                    return True
+                if child < cv and child not in seen and self.contains(child, cv):
+                    seen.add(child)
+                    stack.append(child)
+        return False
+
+    def contains(self, cu, cv):
+        # v's label interval inside u's
+        return self.low[cu] <= self.low[cv] and self.post[cv] <= self.post[cu]
+
+    def distance_bounds(self, u, v):
+        """(lower, upper) bounds on the hop distance from u to v, from the landmarks.
+
+        Returns None if v can't be reached. upper is None when no landmark
+        lies on a path between them.
+        """
+        if not self.can_reach(u, v):
+            return None
+        if u == v:
+            return 0, 0
+        lower, upper = 1, None
+        for to_l, from_l in zip(self.to_landmark, self.from_landmark):
+            # d(u, v) >= d(l, v) - d(l, u) and d(u, v) >= d(u, l) - d(v, l)
+            if u in from_l and v in from_l:
+                lower = max(lower, from_l[v] - from_l[u])
+            if u in to_l and v in to_l:
+                lower = max(lower, to_l[u] - to_l[v])
+            # d(u, v) <= d(u, l) + d(l, v)
+            if u in to_l and v in from_l:
+                through = to_l[u] + from_l[v]
+                if upper is None or through < upper:
+                    upper = through
+        return lower, upper
+
+    def shortest_path(self, u, v):
+        """An exact shortest path from u to v as a list, or None if there is none."""
+        key = (u, v)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        path = None
+        if self.can_reach(u, v):
+            cv = self.component_of[v]
+            neighbors = out_neighbors(self.graph)
+            parents = {u: None}
+            queue = deque([u])
+            while queue and v not in parents:
+                node = queue.popleft()
+                if node not in self.graph:
+                    continue  # Only a target, no outgoing edges
+                for next in neighbors(node):
+                    # Skip vertices whose component comes after v's
+                    if next not in parents and self.component_of[next] <= cv:
+                        parents[next] = node
+                        queue.append(next)
+            path = bfs_path(parents, u, v)
+
+        self.cache[key] = path
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return path
+
+    def distance(self, u, v):
+        """Exact hop distance from u to v, or None if there is no path."""
+        path = self.shortest_path(u, v)
+        return None if path is None else len(path) - 1
+
+    def save(self, filename):
+        """Write the index (everything except the graph and cache) to a file."""
+        state = dict(self.__dict__)
+        del state['graph'], state['cache']
+        with open(filename, 'wb') as index_file:
+            pickle.dump((self.version, state), index_file, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, filename, graph):
+        """Read an index written by save; 'graph' is used for exact paths."""
+        with open(filename, 'rb') as index_file:
+            version, state = pickle.load(index_file)
+        if version != cls.version:
+            raise ValueError('index file has version ' + str(version))
+        index = cls.__new__(cls)
+        index.__dict__.update(state)
+        index.graph = graph
+        index.cache = OrderedDict()
+        return index
+
+
+def reachability_index(input_filename, landmarks=8, cache_size=1024):
+    """Load the ReachabilityIndex saved next to an input file, or build and save it.
+
+    The index is kept in '<input_filename>.reach' and rebuilt whenever the
+    input file is newer than it.
+    """
+    index_filename = input_filename + '.reach'
     graph = read_graph(input_filename)
+    if (os.path.exists(index_filename) and
+            os.path.getmtime(index_filename) >= os.path.getmtime(input_filename)):
+        try:
+            index = ReachabilityIndex.load(index_filename, graph)
+            index.cache_size = cache_size
+            return index
+        except (ValueError, pickle.UnpicklingError, EOFError):
+            pass
+    index = ReachabilityIndex(graph, landmarks, cache_size)
+    index.save(index_filename)
+    return index
+
+
+# What each worker process of a TraversalExecutor sees: the graph, rebuilt
+# as a CSRGraph over the shared block without copying the arrays
+traversal_state = {}
+
+
+def traversal_worker_init(name, num_vertices, num_edges, num_nodes):
+    block = shared_memory.SharedMemory(name=name)
+    ints = block.buf.cast('i')
+    offsets = ints[:num_vertices + 1]
+    neighbors = ints[num_vertices + 1:num_vertices + 1 + num_edges]
+    nodes = ints[num_vertices + 1 + num_edges:num_vertices + 1 + num_edges + num_nodes]
+    traversal_state['block'] = block
+    traversal_state['graph'] = OrderedCSRGraph(offsets, neighbors, nodes)
+
+
+def traversal_bfs(source):
+    return bfs_tree(traversal_state['graph'], source)
+
+
+def traversal_dfs(source):
+    return dfs(traversal_state['graph'], source)
+
+
+def traversal_bfs_report(source):
+    graph = traversal_state['graph']
+    return bfs_report(graph, source, bfs_tree(graph, source)[1], bfs_path)
+
+
+def traversal_cleanup(pool, block):
+    pool.terminate()
+    pool.join()
+    block.unlink()
+
+
+class TraversalExecutor:
+    """Run BFS or DFS from many start vertices on a pool of processes.
+
+    The graph is copied once into a shared memory block in CSR form
+    (offsets, neighbors and the vertex list, as 32-bit ints). Every worker
+    wraps the block in a CSRGraph, so nothing is copied per task. Sources
+    are handed out 'chunk' at a time and the results come back in source
+    order as soon as they are ready, so they can be written out while the
+    workers keep going.
+
+    The workers see the graph exactly like read_graph returns it, so every
+    search gives the same result as running it in this process.
+    """
+
+    kinds = {'bfs': traversal_bfs, 'dfs': traversal_dfs, 'bfs_report': traversal_bfs_report}
+
+    def __init__(self, graph, workers=None, chunk=None):
+        if shared_memory is None:
+            raise ImportError('TraversalExecutor needs Python 3.8 or newer')
+        # Each vertex's edges go in the order graph[v] iterates them
+        if isinstance(graph, CSRGraph):
+            (offsets, neighbors), nodes = graph.set_ordered(), graph.nodes
+        else:
+            offsets, neighbors, nodes = self.to_csr(graph)
+        self.nodes = list(nodes)
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunk = chunk
+
+        sizes = (len(offsets), len(neighbors), len(nodes))
+        self.block = shared_memory.SharedMemory(create=True, size=max(4, 4 * sum(sizes)))
+        ints = self.block.buf.cast('i')
+        start = 0
+        for part in (offsets, neighbors, nodes):
+            ints[start:start + len(part)] = array('i', part)
+            start += len(part)
+        ints.release()
+
+        self.pool = multiprocessing.Pool(self.workers, traversal_worker_init,
+                                         (self.block.name, sizes[0] - 1, sizes[1], sizes[2]))
+        self.finalizer = weakref.finalize(self, traversal_cleanup, self.pool, self.block)
+
+    @staticmethod
+    def to_csr(graph):
+        """CSR arrays of a dictionary graph, keeping each set's iteration order."""
+        num_vertices = max([v for v in graph.keys()] +
+                           [w for v in graph.keys() for w in graph[v]] + [0]) + 1
+        offsets, neighbors = array('i', [0]), array('i')
+        for v in range(num_vertices):
+            if v in graph:
+                neighbors.extend(graph[v])
+            offsets.append(len(neighbors))
+        return offsets, neighbors, array('i', graph.keys())
+
+    def map(self, kind, sources=None):
+        """Yield the result of searching from every source, in source order.
+
+        kind is 'bfs' (the (distances, parents) of bfs_tree), 'dfs' (a
+        DFSResult) or 'bfs_report' (the text write_bfs_output would write
+        for that source). sources defaults to every vertex.
+        """
+        if sources is None:
+            sources = self.nodes
+        sources = list(sources)
+        # Default: about four chunks per worker, so the load stays balanced
+        chunk = self.chunk or max(1, -(-len(sources) // (self.workers * 4)))
+        return self.pool.imap(self.kinds[kind], sources, chunk)
+
+    def close(self):
+        self.finalizer()
+        self.block.close()
+
+
+def write_all_bfs_output(input_filename, output_filename, workers=None, chunk=None):
+    """Create an output file with the BFS report from every vertex, one section per source.
+
+    The searches run on a TraversalExecutor and each section is written as
+    soon as it (and every section before it) is done.
+    """
+    graph = read_graph_csr(input_filename)
+    executor = TraversalExecutor(graph, workers, chunk)
+    try:
+        sources = range(1, len(graph.keys()) + 1)
+        with open(output_filename, 'w') as output_file:
+            for source, report in zip(sources, executor.map('bfs_report', sources)):
+                output_file.write('Source: ' + str(source) + '\n')
+                output_file.write(report)
+    finally:
+        executor.close()
+
+
+def write_scc_output(input_filename, output_filename, compress=None):
+    """Create an output file with the strongly connected components of the graph."""
+    # Read the graph
+    with phase('read_graph'):
+        graph = read_graph(input_filename)
+    write_scc_report(graph, output_filename, compress)
+
+
+def write_scc_report(graph, output_filename, compress=None):
+    """Write the strongly connected components report of an already loaded graph."""
+    with phase('scc'):
+        components, component_of, dag = condensation(graph)
     # Write the output file
-    with open(output_filename, 'w') as output_file:
-        # Write the header
-        output_file.write('Vertex: Distance [Path]\n')
-        # For each node in the graph
-        for node in range(1, len(graph.keys()) + 1):
-            # Seach for shortest paths from node #1 to this node
-            paths = bfs_paths(graph, 1, node)
-            # If paths exist
-            if paths:
-                # Write the node number
-                output_file.write(str(node) + ' : ')
-                # Write the number of edges in the path (which is the number of nodes - 1)
-                output_file.write(str(len(paths) - 1) + ' ')
-                # Write the shortest path itself
-                output_file.write(str(paths) + '\n')
-
-def write_dfs_output(input_filename, output_filename):
-    """Create an output file with DFS data for the given input file."""
+    with phase('write'), ReportWriter(output_filename, compress) as output_file:
+        # Components are numbered from 0 in topological order
+        for number, component in enumerate(components):
+            output_file.write("Component: "+str(number)+" : "+str(sorted(component))+'\n')
+        edges = sorted((u, v) for u in dag for v in dag[u])
+        output_file.write("Condensation edges: "+str(edges)+'\n')
+        output_file.write("Components in topological order: "+str(list(range(len(components))))+'\n')
+
+
+class ReportWriter:
+    """Write an output file in large pieces, optionally gzip-compressed.
+
+    Text is collected in memory and written once 'buffer_size' characters
+    have piled up, instead of one small write per value. With compress=True
+    (the default when the file name ends in '.gz') the file is gzipped.
+    Use it in a 'with' block so the last piece gets written.
+    """
+
+    def __init__(self, filename, compress=None, buffer_size=1 << 20):
+        if compress is None:
+            compress = filename.endswith('.gz')
+        self.file = gzip.open(filename, 'wt') if compress else open(filename, 'w')
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def write_lines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def write_list(self, items, chunk=4096):
+        """Write the same text as str(items), a few thousand items at a time."""
+        self.write('[')
+        for start in range(0, len(items), chunk):
+            if start:
+                self.write(', ')
+            self.write(', '.join(map(str, items[start:start + chunk])))
+        self.write(']')
+
+    def flush(self):
+        self.file.write(''.join(self.parts))
+        self.parts = []
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_bfs_output(input_filename, output_filename, vectorized=False,
+                     compact=False, compress=None):
+    """Create an output file with BFS data for the given input file.
+
+    With vectorized=True the graph is loaded as a CSRGraph and searched
+    with bfs_numpy (following edges in set order, so the paths don't change).
+
+    With compact=True every vertex gets its distance and parent instead of
+    the whole path, so the file stays O(V) however deep the tree is (see
+    read_bfs_compact). compress works like in ReportWriter.
+    """
     # Read the graph
-    graph = read_graph(input_filename)
+    with phase('read_graph'):
+        if vectorized:
+            graph = read_graph_csr(input_filename)
+        else:
+            graph = read_graph(input_filename)
+    write_bfs_report(graph, output_filename, vectorized, compact, compress)
+
+def write_bfs_report(graph, output_filename, vectorized=False, compact=False, compress=None):
+    """Write the BFS report of an already loaded graph (a CSRGraph if vectorized)."""
+    # One BFS from node #1 gives the shortest paths to every node
+    with phase('bfs'):
+        if 1 not in graph:
+            # Only an empty input has no node #1, and then no lines to write
+            distances, parents = {}, {}
+            path_to = bfs_path
+        elif vectorized:
+            distances, parents = bfs_numpy(graph, 1, set_order=True)
+            path_to = bfs_path_array
+        else:
+            distances, parents = bfs_tree(graph, 1)
+            path_to = bfs_path
+    # Write the output file (the paths are rebuilt as the lines are written)
+    with phase('write'), ReportWriter(output_filename, compress) as output_file:
+        if compact:
+            output_file.write_lines(bfs_compact_lines(graph, distances, parents))
+        else:
+            output_file.write_lines(bfs_report_lines(graph, 1, parents, path_to))
+
+def bfs_report(graph, source, parents, path_to):
+    """The text of a BFS output file for the searches from 'source'."""
+    return ''.join(bfs_report_lines(graph, source, parents, path_to))
+
+def bfs_report_lines(graph, source, parents, path_to):
+    """Yield the lines of a BFS output file for the searches from 'source'."""
+    # Write the header
+    yield 'Vertex: Distance [Path]\n'
+    # For each node in the graph
+    for node in range(1, len(graph.keys()) + 1):
+        # Rebuild the shortest path from the source to this node
+        paths = path_to(parents, source, node)
+        # If paths exist
+        if paths:
+            yield bfs_report_line(node, paths)
+
+def bfs_compact_lines(graph, distances, parents):
+    """Yield the lines of a compact BFS output file: 'node : distance parent'.
+
+    The source has parent None, and unreachable vertices 'None None'.
+    Takes the dictionaries of bfs_tree or the arrays of bfs_numpy.
+    """
+    if isinstance(distances, dict):
+        distance_of, parent_of = distances.get, parents.get
+    else:
+        # bfs_numpy marks "none" with -1
+        def distance_of(node):
+            return int(distances[node]) if node < len(distances) and distances[node] >= 0 else None
+        def parent_of(node):
+            return int(parents[node]) if node < len(parents) and parents[node] >= 0 else None
+    yield 'Vertex: Distance Parent\n'
+    for node in range(1, len(graph.keys()) + 1):
+        yield str(node) + ' : ' + str(distance_of(node)) + ' ' + str(parent_of(node)) + '\n'
+
+def read_bfs_compact(filename):
+    """Read a compact BFS output file back into (distances, parents).
+
+    These are the dictionaries bfs_tree returns, so bfs_path rebuilds any path.
+    """
+    distances, parents = {}, {}
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'rt') as input_file:
+        next(input_file)
+        for line in input_file:
+            node, distance, parent = line.replace(' : ', ' ').split()
+            if distance != 'None':
+                distances[int(node)] = int(distance)
+                parents[int(node)] = None if parent == 'None' else int(parent)
+    return distances, parents
+
+def bfs_report_line(node, path):
+    """One line of a BFS output file: the node number, the number of edges in
+    the path (which is the number of nodes - 1) and the shortest path itself."""
+    return str(node) + ' : ' + str(len(path) - 1) + ' ' + str(path) + '\n'
+
+
+class DynamicBFS:
+    """BFS distances and parents from one source, kept up to date while
+    edges are added and removed (Ramalingam-Reps style, unit weights).
+
+    - add_edge(u, v): if it gives v a shorter path, the shorter distances
+      spread out from v with a BFS that only visits vertices that improve.
+    - remove_edge(u, v): nothing happens unless (u, v) was v's tree edge.
+      Otherwise only v's subtree can get farther away. Going through it
+      level by level, a vertex that still has an in-edge from a vertex one
+      level closer (that is not itself getting farther) just switches
+      parent. The rest get their new distances from their remaining
+      in-edges, closest first, and those that have none become unreachable.
+
+    Each update costs time in proportion to the vertices whose distance or
+    parent changes and their edges, not the size of the graph. report()
+    only rebuilds the lines of the BFS output whose path changed.
+
+    Distances always equal those of a new search. When several shortest
+    paths exist, the one kept may differ from what bfs_tree would pick.
+    """
+
+    def __init__(self, graph, source=1):
+        self.source = source
+        self.graph = {u: set(graph[u]) for u in graph.keys()}
+        # The vertices with an edge out of them (read_graph's sources)
+        self.sources = {u for u in self.graph if self.graph[u]}
+        self.predecessors = defaultdict(set)
+        for u in self.graph:
+            for v in self.graph[u]:
+                self.predecessors[v].add(u)
+        if source in self.graph:
+            self.distances, self.parents = bfs_tree(graph, source)
+        else:
+            self.distances, self.parents = {source: 0}, {source: None}
+        self.children = defaultdict(set)
+        for v, u in self.parents.items():
+            if u is not None:
+                self.children[u].add(v)
+        # Cached report lines, and the vertices whose line must be rebuilt
+        self.lines = {}
+        self.changed = set(self.graph)
+
+    def set_parent(self, v, u, distance):
+        old = self.parents.get(v)
+        if old is not None:
+            self.children[old].discard(v)
+        if u is not None:
+            self.children[u].add(v)
+        self.parents[v] = u
+        self.distances[v] = distance
+        self.changed.add(v)
+
+    def unreach(self, v):
+        old = self.parents.pop(v)
+        if old is not None:
+            self.children[old].discard(v)
+        del self.distances[v]
+        self.changed.add(v)
+
+    def add_edge(self, u, v):
+        """Add the edge (u, v) and update the distances it shortens."""
+        # Like read_graph, every vertex with an edge out of it is a key
+        self.graph.setdefault(u, set()).add(v)
+        self.sources.add(u)
+        self.predecessors[v].add(u)
+        if u not in self.distances:
+            return
+        if v in self.distances and self.distances[v] <= self.distances[u] + 1:
+            return
+        self.set_parent(v, u, self.distances[u] + 1)
+        queue = deque([v])
+        while queue:
+            node = queue.popleft()
+            for next in self.graph.get(node, ()):
+                if next not in self.distances or self.distances[next] > self.distances[node] + 1:
+                    self.set_parent(next, node, self.distances[node] + 1)
+                    queue.append(next)
+
+    def remove_edge(self, u, v):
+        """Remove the edge (u, v) and update the distances it lengthens."""
+        self.graph[u].remove(v)
+        if not self.graph[u]:
+            self.sources.discard(u)
+        self.predecessors[v].discard(u)
+        if self.parents.get(v) != u:
+            return
+
+        # v's subtree, in order of distance (a BFS over the tree children)
+        subtree = [v]
+        for node in subtree:
+            subtree.extend(self.children[node])
+
+        # Keep the distance of every vertex with a parent one level closer
+        # that isn't getting farther; the others are 'affected'
+        affected = set()
+        for node in subtree:
+            level = self.distances[node] - 1
+            for previous in self.predecessors[node]:
+                if (previous not in affected and previous in self.distances and
+                        self.distances[previous] == level):
+                    if previous != self.parents[node]:
+                        self.set_parent(node, previous, level + 1)
+                    break
+            else:
+                affected.add(node)
+
+        # Affected vertices: best distance through edges from outside the
+        # affected set, then settle them closest first
+        heap = []
+        for node in affected:
+            self.unreach(node)
+        for node in affected:
+            for previous in self.predecessors[node]:
+                if previous in self.distances:
+                    heapq.heappush(heap, (self.distances[previous] + 1, node, previous))
+        while heap:
+            distance, node, previous = heapq.heappop(heap)
+            if node in self.distances:
+                continue
+            self.set_parent(node, previous, distance)
+            for next in self.graph.get(node, ()):
+                if next in affected and next not in self.distances:
+                    heapq.heappush(heap, (distance + 1, next, node))
+
+    def report(self):
+        """The text write_bfs_output would write for the current graph."""
+        # A changed parent changes the paths of the whole subtree below it
+        stack = list(self.changed)
+        changed = set(stack)
+        while stack:
+            for child in self.children[stack.pop()]:
+                if child not in changed:
+                    changed.add(child)
+                    stack.append(child)
+        for node in changed:
+            self.lines[node] = bfs_report_line(node, bfs_path(self.parents, self.source, node))
+        self.changed = set()
+
+        # read_graph's keys for the current edges: the sources, plus any of
+        # 1 .. (number of sources) that is not one
+        num_sources = len(self.sources)
+        num_nodes = num_sources + sum(1 for node in range(1, num_sources + 1)
+                                      if node not in self.sources)
+        lines = ['Vertex: Distance [Path]\n']
+        for node in range(1, num_nodes + 1):
+            if node not in self.lines:
+                self.lines[node] = bfs_report_line(node, bfs_path(self.parents, self.source, node))
+            lines.append(self.lines[node])
+        return ''.join(lines)
+
+    def write_report(self, output_filename):
+        with open(output_filename, 'w') as output_file:
+            output_file.write(self.report())
+
+def write_dfs_output(input_filename, output_filename, compress=None):
+    """Create an output file with DFS data for the given input file.
+
+    Goes through a ReportWriter, so the edge lists are written piece by
+    piece instead of as one big string; compress works like there.
+    """
+    # Read the graph
+    with phase('read_graph'):
+        graph = read_graph(input_filename)
+    write_dfs_report(graph, output_filename, compress)
+
+
+def write_dfs_report(graph, output_filename, compress=None):
+    """Write the DFS report of an already loaded graph."""
+    # One DFS from node #1 gives the times, tree and order
+    with phase('dfs'):
+        if 1 in graph:
+            result = dfs(graph, 1)
+            times, tree, order = result.times, result.tree, result.order
+        else:
+            # Only an empty input has no node #1
+            times, tree, order = {}, [], []
+    with phase('dfs_edges'):
+        back, forward, cross = dfs_edges(tree, graph, order)
     # Write the output file
-    with open(output_filename, 'w') as output_file:
+    with phase('write'), ReportWriter(output_filename, compress) as output_file:
         # For each node in the graph
         for node in range(1, len(graph.keys()) + 1):
-            # Seach for shortest paths from node #1 to this node
-            times = dfs_times(graph, 1)
-            output_file.write("Discover/Finish: "+str(node)+" : ")
             if 'discovery' not in times[node]:
-                output_file.write('None None\n')
+                output_file.write("Discover/Finish: "+str(node)+" : None None\n")
             else:
-                output_file.write(str(times[node]['discovery'])+' '+str(times[node]['finish'])+'\n')
-        tree = dfs_tree(graph, 1)
-        output_file.write("Tree: "+str(tree)+'\n')
+                output_file.write("Discover/Finish: "+str(node)+" : "+str(times[node]['discovery'])+' '+str(times[node]['finish'])+'\n')
+        for name, edges in (("Tree", tree), ("Back", back), ("Forward", forward),
+                            ("Cross", cross), ("Vertices in topological order", order)):
+            output_file.write(name + ": ")
+            output_file.write_list(edges)
+            output_file.write('\n')
 
-        order = dfs_order(graph, 1)        
-        back, forward, cross = dfs_edges(tree, graph, order)
-        output_file.write("Back: "+str(back)+'\n')
-        output_file.write("Forward: "+str(forward)+'\n')
-        output_file.write("Cross: "+str(cross)+'\n')
-        output_file.write("Vertices in topological order: "+str(order)+'\n')
+
+# The reports the pipeline can write, by name
+GRAPH_REPORTS = {
+    'bfs': write_bfs_report,
+    'dfs': write_dfs_report,
+    'scc': write_scc_report,
+    'hops': write_hops_report,
+}
+
+
+def report_filename(input_filename, report, output_dir='.', pattern='{report}_{id}.txt',
+                    compress=False):
+    """Where a report for an input file goes.
+
+    pattern can use {report}, {name} (the input file name without its
+    extension) and {id} (the same without an 'input_' prefix), so the
+    default turns input_1.txt into bfs_1.txt. '.gz' is added when compressed.
+    """
+    name = os.path.splitext(os.path.basename(input_filename))[0]
+    short = name[len('input_'):] if name.startswith('input_') else name
+    filename = os.path.join(output_dir, pattern.format(report=report, name=name, id=short))
+    if compress and not filename.endswith('.gz'):
+        filename += '.gz'
+    return filename
+
+
+def process_graph_file(input_filename, reports=('bfs', 'dfs'), output_dir='.',
+                       pattern='{report}_{id}.txt', compact=False, compress=False):
+    """Read one input file once and write every report asked for from it.
+
+    Returns the names of the files written.
+    """
+    with phase('read_graph'):
+        graph = read_graph(input_filename)
+    written = []
+    for report in reports:
+        output_filename = report_filename(input_filename, report, output_dir, pattern, compress)
+        if report == 'bfs':
+            write_bfs_report(graph, output_filename, compact=compact, compress=compress)
+        else:
+            GRAPH_REPORTS[report](graph, output_filename, compress=compress)
+        written.append(output_filename)
+    return written
+
+
+def run_pipeline(input_filenames, reports=('bfs', 'dfs'), output_dir='.',
+                 pattern='{report}_{id}.txt', compact=False, compress=False, workers=None):
+    """Process many input files, up to 'workers' at the same time.
+
+    Every file is handled by process_graph_file in its own worker process
+    (the parsing and searching is pure Python, so threads wouldn't help).
+    With workers=1 everything runs in this process instead. Yields
+    (input file, files written) in input order as each file is done.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    options = (reports, output_dir, pattern, compact, compress)
+    if workers is None:
+        workers = min(len(input_filenames), os.cpu_count() or 1)
+    if workers <= 1:
+        for input_filename in input_filenames:
+            yield input_filename, process_graph_file(input_filename, *options)
+        return
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(process_graph_file, input_filename, *options)
+                   for input_filename in input_filenames]
+        for input_filename, future in zip(input_filenames, futures):
+            yield input_filename, future.result()
 
 
 # If we call this script from the command line
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Write BFS, DFS and other reports for graph edge list files.')
+    parser.add_argument('inputs', nargs='*', default=['input_*.txt'],
+                        help='input files or glob patterns (default: input_*.txt)')
+    parser.add_argument('-r', '--reports', default='bfs,dfs',
+                        help='comma-separated reports to write, from: '
+                             + ', '.join(GRAPH_REPORTS) + ' (default: bfs,dfs)')
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help='folder for the output files (default: current folder)')
+    parser.add_argument('--pattern', default='{report}_{id}.txt',
+                        help='output file names, using {report}, {name} and {id} '
+                             '(default: {report}_{id}.txt)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='files processed at the same time (default: one per CPU)')
+    parser.add_argument('--compact', action='store_true',
+                        help='BFS reports list each vertex\'s parent instead of its path')
+    parser.add_argument('--gzip', action='store_true', help='compress the output files')
+    parser.add_argument('--instrument', nargs='?', const='-', metavar='FILE',
+                        help='write a JSON report of counters and phase times at exit '
+                             '(counts only this process, so use with -j 1)')
+    args = parser.parse_args()
+
+    # Here, all files are located in the script folder by default
+    input_filenames = []
+    for pattern in args.inputs:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            parser.error('no input files match ' + pattern)
+        input_filenames.extend(matches)
+    reports = [report.strip() for report in args.reports.split(',') if report.strip()]
+    for report in reports:
+        if report not in GRAPH_REPORTS:
+            parser.error('unknown report ' + repr(report))
+    if args.instrument:
+        enable_instrumentation(args.instrument)
 
     # Process each input file and write output files
-    # Here, all files are located in the script folder
-    write_bfs_output("input_1.txt", "bfs_1.txt")
-    write_bfs_output("input_2.txt", "bfs_2.txt")
-    write_bfs_output("input_3.txt", "bfs_3.txt")
-
-    write_dfs_output("input_1.txt", "dfs_1.txt")
-    write_dfs_output("input_2.txt", "dfs_2.txt")
-    write_dfs_output("input_3.txt", "dfs_3.txt")
+    for input_filename, written in run_pipeline(input_filenames, reports, args.output_dir,
+                                                args.pattern, args.compact, args.gzip,
+                                                args.workers):
+        print(input_filename + ': ' + ', '.join(written))
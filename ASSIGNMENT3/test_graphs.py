@@ -0,0 +1,127 @@
+"""Checks for graphs.py. Run with "python -m pytest" from this folder."""
+import os
+import random
+from collections import defaultdict
+
+import graphs
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_edges(path, edges):
+    """Write an edge list file in the read_graph format and return its name."""
+    path.write_text(''.join('%d %d\n' % edge for edge in edges))
+    return str(path)
+
+
+def test_reports_of_empty_input(tmp_path):
+    input_filename = write_edges(tmp_path / 'input_empty.txt', [])
+    output_filename = str(tmp_path / 'output.txt')
+    # Just the header, like the original write_bfs_output
+    for options, header in (({}, 'Vertex: Distance [Path]\n'),
+                            ({'compact': True}, 'Vertex: Distance Parent\n'),
+                            ({'vectorized': graphs.np is not None}, 'Vertex: Distance [Path]\n')):
+        graphs.write_bfs_output(input_filename, output_filename, **options)
+        with open(output_filename) as output_file:
+            assert output_file.read() == header
+    written = dict(graphs.run_pipeline([input_filename], output_dir=str(tmp_path),
+                                       workers=1))
+    assert len(written[input_filename]) == 2
+
+
+def test_searches_on_binary_graph(tmp_path):
+    for name in ('input_1.txt', 'input_2.txt', 'input_3.txt'):
+        graph = graphs.read_graph(os.path.join(HERE, name))
+        binary = graphs.read_graph_binary(graphs.write_graph_binary(
+            os.path.join(HERE, name), str(tmp_path / (name + '.csr'))))
+        assert graphs.bfs_tree(binary, 1) == graphs.bfs_tree(graph, 1)
+        assert graphs.dfs(binary, 1) == graphs.dfs(graph, 1)
+        for node in graph:
+            path = graphs.bfs_paths(binary, 1, node)
+            assert len(path) == len(graphs.bfs_paths(graph, 1, node))
+            assert path[0] == 1 and all(b in graph[a] for a, b in zip(path, path[1:]))
+        assert graphs.bfs_paths(binary, 1, 1) == [1]
+
+
+def test_bottom_up_bfs_levels_match_bfs_tree(monkeypatch):
+    # Count the bottom-up steps without registering the report at exit
+    monkeypatch.setattr(graphs, 'stats', {'counters': defaultdict(int),
+                                          'phases': defaultdict(float)})
+    rnd = random.Random(7)
+    for _ in range(50):
+        size = rnd.randint(1, 40)
+        graph = {v: set() for v in range(1, size + 1)}
+        for _ in range(rnd.randint(0, 4 * size)):
+            graph[rnd.randint(1, size)].add(rnd.randint(1, size))
+        predecessors = graphs.reverse_graph(graph)
+        for start in graph:
+            # Huge alpha and beta: go bottom-up right away and stay there
+            distances, parents = graphs.bfs_levels(graph, start, alpha=10 ** 9, beta=10 ** 9,
+                                                   predecessors=predecessors)
+            assert distances == graphs.bfs_tree(graph, start)[0]
+            assert parents[start] is None and set(parents) == set(distances)
+            for node, parent in parents.items():
+                if node != start:
+                    assert node in graph[parent]
+                    assert distances[parent] == distances[node] - 1
+    assert graphs.stats['counters']['bottom_up_checks'] > 0
+
+
+def report_distances(report):
+    """The (node, distance) of every line of a BFS report, without the paths."""
+    return [tuple(line.split(' [')[0].split(' : ')) for line in report.splitlines()[1:]]
+
+
+def test_dynamic_bfs_report_range(tmp_path):
+    graph = graphs.read_graph(write_edges(tmp_path / 'input.txt', [(1, 2), (2, 5), (5, 1)]))
+    dynamic = graphs.DynamicBFS(graph)
+    dynamic.add_edge(7, 1)
+    # Sources 1, 2, 5, 7 plus the missing 3 and 4
+    assert [node for node, distance in report_distances(dynamic.report())] == [
+        '1', '2', '3', '4', '5', '6']
+    dynamic.remove_edge(7, 1)
+    assert len(dynamic.report().splitlines()) == 5
+
+
+def test_dynamic_bfs_report_covers_read_graph_vertices(tmp_path):
+    rnd = random.Random(5)
+    for _ in range(100):
+        edges = [(rnd.randint(1, 6), rnd.randint(1, 6)) for _ in range(rnd.randint(0, 12))]
+        input_filename = write_edges(tmp_path / 'input.txt', edges)
+        graph = graphs.read_graph(input_filename)
+        # The original BFS fails on an edge to a vertex that read_graph
+        # doesn't make a key, so such inputs are left out
+        if any(v not in graph for u, v in edges):
+            continue
+        dynamic = graphs.DynamicBFS(graph)
+        edges = set(edges)
+        for _ in range(15):
+            if edges and rnd.random() < 0.4:
+                edge = rnd.choice(sorted(edges))
+                edges.remove(edge)
+                dynamic.remove_edge(*edge)
+            else:
+                edge = (rnd.randint(1, 8), rnd.randint(1, 8))
+                edges.add(edge)
+                dynamic.add_edge(*edge)
+            input_filename = write_edges(tmp_path / 'input.txt', sorted(edges))
+            graph = graphs.read_graph(input_filename)
+            if any(v not in graph for u, v in edges):
+                continue
+            output_filename = str(tmp_path / 'output.txt')
+            graphs.write_bfs_output(input_filename, output_filename)
+            with open(output_filename) as output_file:
+                expected = output_file.read()
+            assert report_distances(dynamic.report()) == report_distances(expected)
+
+
+def test_reachability_index_with_target_only_vertex(tmp_path):
+    # read_graph doesn't make 3 a key, it only appears as a target
+    graph = graphs.read_graph(write_edges(tmp_path / 'input.txt', [(1, 2), (2, 3)]))
+    index = graphs.ReachabilityIndex(graph)
+    assert index.can_reach(1, 3) and not index.can_reach(3, 1)
+    assert index.shortest_path(1, 3) == [1, 2, 3]
+    assert index.distance(2, 3) == 1
+    assert index.distance(3, 1) is None
+    lower, upper = index.distance_bounds(1, 3)
+    assert lower <= 2 and (upper is None or upper >= 2)
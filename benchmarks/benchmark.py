@@ -0,0 +1,234 @@
+# Benchmarks for the segment intersection code (ASSIGNMENT1/main.py) and the
+# graph traversal code (ASSIGNMENT3/graphs.py).
+#
+# Inputs are generated from a seed, in the exact text formats the two
+# programs read, so every run times the same files. Each timed step is run
+# 'repeat' times and the best time is kept; peak memory is measured in one
+# more run with tracemalloc on (it slows things down, so it is never timed).
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'ASSIGNMENT1'))
+sys.path.insert(0, os.path.join(HERE, '..', 'ASSIGNMENT3'))
+
+import main
+import graphs
+
+
+def generate_segments(filename, count, density=1.0, clusters=0, seed=0):
+    """Write 'count' random segments in the get_lines format.
+
+    - density: about how many other segments each one crosses when they are
+      spread evenly (segment length grows with its square root)
+    - clusters: 0 spreads the segments over the whole area, otherwise their
+      midpoints are packed around that many random centres
+    Coordinates sit in the same latitude/longitude box as the sample inputs.
+    """
+    rnd = random.Random(seed)
+    left, bottom, side = 37.0, -123.0, 1.0
+    # n random segments of length l in a unit square cross about
+    # (2 / pi) * n * l^2 others each
+    length = side * min(1.0, math.sqrt(density * math.pi / (2 * max(count, 1))))
+    centres = [(left + rnd.random() * side, bottom + rnd.random() * side)
+               for _ in range(clusters)]
+    spread = side / (4 * math.sqrt(max(clusters, 1)))
+    with open(filename, 'w') as output_file:
+        for number in range(1, count + 1):
+            if centres:
+                cx, cy = rnd.choice(centres)
+                x, y = rnd.gauss(cx, spread), rnd.gauss(cy, spread)
+            else:
+                x, y = left + rnd.random() * side, bottom + rnd.random() * side
+            angle = rnd.random() * math.pi
+            dx, dy = length / 2 * math.cos(angle), length / 2 * math.sin(angle)
+            output_file.write('%d: ([%.6f, %.6f], [%.6f, %.6f]) \n'
+                              % (number, x - dx, y - dy, x + dx, y + dy))
+
+
+def generate_graph(filename, vertices, edges, skew=0.0, diameter=None, seed=0):
+    """Write a random directed graph in the read_graph format.
+
+    - every vertex 1..vertices gets at least one outgoing edge (so read_graph
+      sees all of them as keys); the rest are random, up to 'edges' in all
+    - skew: 0 picks edge sources evenly, larger values favour low-numbered
+      vertices (Zipf-like weights 1 / rank^skew), giving a few hubs
+    - diameter: None gives a random graph with short paths. Otherwise the
+      vertices are split into diameter + 1 non-empty layers (vertex 1 alone
+      in the first), every vertex gets an edge from the layer before it, and
+      no edge skips a layer forward, so BFS from vertex 1 is exactly that
+      deep. It can be at most vertices - 1.
+    """
+    rnd = random.Random(seed)
+    if diameter:
+        if diameter > vertices - 1:
+            raise ValueError('diameter %d needs more than %d vertices' % (diameter, vertices))
+        layers = [[1]]
+        rest = list(range(2, vertices + 1))
+        layers.extend(rest[i * len(rest) // diameter:(i + 1) * len(rest) // diameter]
+                      for i in range(diameter))
+        layer_of = {v: i for i, layer in enumerate(layers) for v in layer}
+        # Everything in layers 0 .. i + 1 is fair game for an edge out of layer i
+        reachable_upto = []
+        for i in range(len(layers)):
+            reachable_upto.append(sum(len(layer) for layer in layers[:i + 2]))
+        flat = [v for layer in layers for v in layer]
+
+        def target(source):
+            return flat[rnd.randrange(reachable_upto[layer_of[source]])]
+    else:
+        def target(source):
+            return rnd.randint(1, vertices)
+
+    weights = None
+    if skew:
+        weights = [1.0 / rank ** skew for rank in range(1, vertices + 1)]
+        total = 0.0
+        for i, weight in enumerate(weights):
+            total += weight
+            weights[i] = total
+    population = range(1, vertices + 1)
+
+    pairs = [(v, target(v)) for v in population]
+    if diameter:
+        for i in range(1, len(layers)):
+            for v in layers[i]:
+                pairs.append((rnd.choice(layers[i - 1]), v))
+    while len(pairs) < edges:
+        if weights:
+            source = rnd.choices(population, cum_weights=weights)[0]
+        else:
+            source = rnd.randint(1, vertices)
+        pairs.append((source, target(source)))
+    rnd.shuffle(pairs)
+    with open(filename, 'w') as output_file:
+        output_file.write(''.join('%d %d\n' % pair for pair in pairs))
+
+
+def measure(step, repeat):
+    """Best wall time of 'repeat' runs of step(), then its peak memory in bytes."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        step()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    step()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def segment_benchmarks(directory, sizes, backend, density, clusters, seed, repeat):
+    results = []
+    for count in sizes:
+        filename = os.path.join(directory, 'segments_%d.txt' % count)
+        generate_segments(filename, count, density, clusters, seed)
+        # check_intersections removes lines from the list it gets, so each
+        # run starts from a fresh copy
+        lines = main.get_lines(filename)
+        steps = [('get_lines', lambda: main.get_lines(filename)),
+                 ('check_intersections[%s]' % backend,
+                  lambda: main.check_intersections(list(lines), backend))]
+        for name, step in steps:
+            seconds, peak = measure(step, repeat)
+            results.append({'name': name, 'size': count, 'unit': 'segments',
+                            'seconds': seconds, 'per_second': count / seconds,
+                            'peak_bytes': peak})
+    return results
+
+
+def graph_benchmarks(directory, sizes, degree, skew, diameter, seed, repeat):
+    results = []
+    for vertices in sizes:
+        edges = vertices * degree
+        filename = os.path.join(directory, 'graph_%d.txt' % vertices)
+        output = os.path.join(directory, 'report.txt')
+        generate_graph(filename, vertices, edges, skew, diameter, seed)
+        steps = [('read_graph', lambda: graphs.read_graph(filename)),
+                 ('write_bfs_output', lambda: graphs.write_bfs_output(filename, output)),
+                 ('write_dfs_output', lambda: graphs.write_dfs_output(filename, output))]
+        for name, step in steps:
+            seconds, peak = measure(step, repeat)
+            results.append({'name': name, 'size': edges, 'unit': 'edges',
+                            'seconds': seconds, 'per_second': edges / seconds,
+                            'peak_bytes': peak})
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print how each result moved against the baseline; return the slowdowns."""
+    old = {(r['name'], r['size']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = old.get((result['name'], result['size']))
+        if before is None:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  SLOWER'
+            regressions.append(result)
+        print('%-32s %10d  %6.2fx time  %6.2fx memory%s'
+              % (result['name'], result['size'], ratio,
+                 result['peak_bytes'] / max(before['peak_bytes'], 1), flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time the segment intersection and graph traversal code on '
+                    'generated inputs.')
+    parser.add_argument('--segments', type=int, nargs='*', default=[100, 200, 400],
+                        help='segment counts to run (none to skip)')
+    parser.add_argument('--backend', default='sweep',
+                        choices=['brute', 'sweep', 'numpy', 'grid', 'parallel'])
+    parser.add_argument('--density', type=float, default=1.0,
+                        help='average crossings per segment')
+    parser.add_argument('--clusters', type=int, default=0,
+                        help='pack the segments around this many centres')
+    parser.add_argument('--graphs', type=int, nargs='*', default=[1000, 10000, 100000],
+                        help='vertex counts to run (none to skip)')
+    parser.add_argument('--degree', type=int, default=4, help='edges per vertex')
+    parser.add_argument('--skew', type=float, default=0.0,
+                        help='Zipf exponent for edge sources (0 = uniform)')
+    parser.add_argument('--diameter', type=int, default=None,
+                        help='BFS depth from vertex 1 (default: random graph)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', metavar='JSON', help='write the results here')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='compare with results saved earlier')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='slowdown allowed by --compare before it fails')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = segment_benchmarks(directory, args.segments, args.backend, args.density,
+                                     args.clusters, args.seed, args.repeat)
+        results += graph_benchmarks(directory, args.graphs, args.degree, args.skew,
+                                    args.diameter, args.seed, args.repeat)
+
+    for result in results:
+        print('%-32s %10d %-8s %9.4f s %12.0f %s/s %10.1f MB peak'
+              % (result['name'], result['size'], result['unit'], result['seconds'],
+                 result['per_second'], result['unit'], result['peak_bytes'] / 1e6))
+
+    if args.save:
+        with open(args.save, 'w') as output_file:
+            json.dump({'python': sys.version.split()[0], 'settings': vars(args),
+                       'results': results}, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as input_file:
+            baseline = json.load(input_file)
+        print()
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)